@@ -1,9 +1,11 @@
 import logging
 import sys
 
-from flask import Flask
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
+from app.metrics import instrument_engine
 from config import Config
 
 db = SQLAlchemy()
@@ -26,6 +28,46 @@ def configure_console_logging(app, level=logging.INFO):
     werkzeug_logger.setLevel(level)
     werkzeug_logger.addHandler(handler)
 
+def sqlite_pragmas(config, role:str)->list[tuple[str,object]]:
+    """
+    Returns the pragmas of a connection role: "writer" (default), "bulk" (scan, import_jsons)
+    or "reader" (the web workers, which never write).
+    """
+    pragmas = [("busy_timeout", config["SQLITE_BUSY_TIMEOUT"]),
+               ("temp_store", config["SQLITE_TEMP_STORE"]),
+               ("mmap_size", config["SQLITE_MMAP_SIZE"])]
+    if role == "reader":
+        # the journal mode belongs to the database file, the writer sets it
+        return pragmas + [("cache_size", config["SQLITE_CACHE_SIZE"]), ("query_only", "ON")]
+    bulk = role == "bulk"
+    return pragmas + [("journal_mode", config["SQLITE_JOURNAL_MODE"]),
+                      ("synchronous", config["SQLITE_BULK_SYNCHRONOUS" if bulk else "SQLITE_SYNCHRONOUS"]),
+                      ("cache_size", config["SQLITE_BULK_CACHE_SIZE" if bulk else "SQLITE_CACHE_SIZE"])]
+
+def configure_sqlite(app):
+    """Applies the pragmas of app.config['SQLITE_ROLE'] to every new SQLite connection."""
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith("sqlite"):
+        return
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in sqlite_pragmas(app.config, app.config['SQLITE_ROLE']):
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def configure_metrics(app):
+    """Counts the statements of every connection for the phase timers of app.metrics."""
+    with app.app_context():
+        instrument_engine(db.engine)
+
+def use_sqlite_role(role:str):
+    """Switches the current app to another connection role, the pooled connections are reopened with it."""
+    current_app.config['SQLITE_ROLE'] = role
+    db.engine.dispose()
+
 def punctuation(value):
     return '{:,.0f}'.format(value).replace(',', '.')
 
@@ -42,6 +84,8 @@ def create_app():
               static_folder = 'static')
     app.config.from_object(Config)
     db.init_app(app)
+    configure_sqlite(app)
+    configure_metrics(app)
     app.jinja_env.filters['punctuation'] = punctuation
     app.jinja_env.filters['to_time'] = to_time
 
@@ -1,30 +1,88 @@
-import json
+import glob
 import os
+import re
+import shutil
+import socket
 import time
-from datetime import datetime, date
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, date, timedelta
+from itertools import islice
 from logging import Logger
-from typing import Optional
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
 
 import click
 from dateutil.relativedelta import relativedelta
 from flask import current_app
 from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import select, delete, exists
+from sqlalchemy import select, delete, exists, insert, update, bindparam, func, or_, text, create_engine, Select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from tqdm import tqdm
 
-from app import db
-from app.models import Search, Itinerary, Route, t_itinerary2route
-from common.kiwi import Tequila, KIWI_DATETIME_FORMAT
+from app import db, use_sqlite_role, punctuation
+from app.history import PriceHistory, observation_values, add_observation, offer_fingerprint
+from app.metrics import timer, timed_iter, log_metrics, save_metrics
+from app.queryplan import query_plan, plan_problems, RANKING_TABLES, RANKING_COVERED
+from app.scanqueue import ScanQueue, LeaseLost, OPEN_STATES
+from app.main.views import warm_longweekend, longweekend_rows, longweekend_codes, asset_resolver, asset_directory
+from app.models import Search, Itinerary, Route, Generation, ScanJob, ScanOrigin, MonthlyTop, Place, Booking, t_itinerary2route
+from common.archive import DumpArchive, DumpManifest, ARCHIVE_SUFFIX
+from common.kiwi import Tequila, KIWI_DATETIME_FORMAT, RateLimiter, SearchResponse, ResponseStream
+
+
+CHUNK_SIZE = 500
+# searches deleted per transaction by the cleanup, and route rowids checked per orphan sweep step
+SEARCH_PURGE_CHUNK = 10
+ROUTE_SWEEP_CHUNK = 20000
+# an unfinished generation this old belongs to a scan that died, its searches can be reclaimed
+GENERATION_STALE_AFTER = timedelta(hours=12)
+# seconds a worker waits for a download, or for a queued job, before it looks at the queue again
+QUEUE_POLL = 1.0
+
+# ranking of the actual itineraries, materialized into monthly_top
+MONTHLY_TOP_SQL = "sql/monthly_5_cheapest.sql"
+
+# itinerary rows, route rows keyed by route_id, (itinerary_id, route_id) links, place rows keyed by code,
+# booking rows keyed by itinerary_id and price observations keyed by fingerprint of one batch
+RowBatch = tuple[list[dict], dict[str, dict], list[tuple[str, str]], dict[str, dict], dict[str, dict],
+                 dict[int, dict]]
+
+# Place columns refreshed when a known airport shows up with different names
+PLACE_UPDATE_COLUMNS = [column.name for column in Place.__table__.c if column.name != "code"]
+
+# Route columns refreshed when a known route shows up again in a later response
+ROUTE_UPDATE_COLUMNS = [column.name for column in Route.__table__.c
+                        if column.name not in ("rowid", "route_id", "local_departure", "local_arrival")]
+
+
+def chunked(items:Iterable, size:int=CHUNK_SIZE):
+    """Splits items into lists small enough for SQLite's bound parameter limit."""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
 
 class RouteCache:
     def __init__(self)->None:
         self.route_cache={}
+        self.missing=set()
+
+    def preload(self,route_ids:set[str])->None:
+        """Loads every not yet cached route of a response with chunked IN queries."""
+        route_ids=[route_id for route_id in route_ids
+                   if route_id not in self.route_cache and route_id not in self.missing]
+        for chunk in chunked(route_ids):
+            for route in Route.query.filter(Route.route_id.in_(chunk)):
+                self.route_cache[route.route_id]=route
+        self.missing.update(route_id for route_id in route_ids if route_id not in self.route_cache)
 
     def get_route(self,route_id:str)->Optional[Route]:
         if route_id in self.route_cache:
             return self.route_cache[route_id]
+        if route_id in self.missing:
+            return None
         route=Route.query.filter_by(route_id=route_id).first()
         if route is None:
             return None
@@ -33,6 +91,7 @@ class RouteCache:
 
     def add_route(self,route:Route)->None:
         self.route_cache[route.route_id]=route
+        self.missing.discard(route.route_id)
 
 
 class DbUtils:
@@ -40,106 +99,323 @@ class DbUtils:
         self.db=db_session
         self.logger=logger
 
-    def clear_active(self)->int:
-        updated = Search.query.filter_by(actual=True).update({'actual':False})
+    def start_generation(self,jobs:Iterable[dict]=())->int:
+        """
+        Registers a new scan generation with its queued jobs (see ScanQueue.plan), its searches stay invisible
+        until it is activated. The unfinished generations are superseded: their open jobs are failed and they
+        are closed, so the cleanup reclaims their searches.
+        """
+        started = datetime.now()
+        generation_table = Generation.__table__
+        job_table = ScanJob.__table__
+        unfinished = select(generation_table.c.rowid).where(generation_table.c.finished.is_(None))
+        self.db.session.execute(update(job_table).where(job_table.c.generation_id.in_(unfinished),
+                                                        job_table.c.state.in_(OPEN_STATES))
+                                .values(state=ScanJob.FAILED, error="superseded", lease_owner=None, updated=started))
+        self.db.session.execute(update(generation_table).where(generation_table.c.finished.is_(None))
+                                .values(finished=started))
+        result = self.db.session.execute(insert(generation_table).values(started=started, active=False))
+        generation_id = result.inserted_primary_key[0]
+        jobs = [dict(values, generation_id=generation_id) for values in jobs]
+        if jobs:
+            self.db.session.execute(insert(job_table), jobs)
+        self.db.session.commit()
+        return generation_id
+
+    def resumable_generation(self)->Optional[int]:
+        """
+        Returns the generation of the last scan if it died before it was activated, None if it finished.
+        Scans older than GENERATION_STALE_AFTER are not resumed, the cleanup may have reclaimed their searches.
+        """
+        generation_table = Generation.__table__
+        last = self.db.session.execute(select(generation_table.c.rowid, generation_table.c.started,
+                                              generation_table.c.finished)
+                                       .order_by(generation_table.c.rowid.desc()).limit(1)).first()
+        if last is None or last.finished is not None or last.started < datetime.now() - GENERATION_STALE_AFTER:
+            return None
+        has_jobs = self.db.session.scalar(select(exists().where(ScanJob.__table__.c.generation_id == last.rowid)))
+        return last.rowid if has_jobs else None
+
+    def activate_generation(self,generation_id:int,carried:Optional[dict[int,list[int]]]=None)->bool:
+        """
+        Makes the searches of a finished generation the actual ones, in a single transaction, so readers
+        switch from the complete old dataset to the complete new one, monthly_top included.
+        carried maps the new searches to the rowids of the unchanged itineraries an incremental scan did not
+        insert again, they are moved from the old searches in the same transaction.
+        A generation without any search, finished already or older than the active one is closed without
+        activation, the previous one stays visible.
+        """
+        search_table = Search.__table__
+        generation_table = Generation.__table__
+        generation = self.db.session.execute(select(generation_table.c.finished).where(
+            generation_table.c.rowid == generation_id)).one()
+        superseded = self.db.session.scalar(select(exists().where(generation_table.c.active.is_(True),
+                                                                  generation_table.c.rowid > generation_id)))
+        if generation.finished is not None or superseded:
+            # closed by another worker, or a later scan is already visible
+            self.db.session.execute(update(generation_table).where(generation_table.c.rowid == generation_id,
+                                                                   generation_table.c.finished.is_(None))
+                                    .values(finished=datetime.now()))
+            self.db.session.commit()
+            self.logger.warning(f"Generation {generation_id} is finished or superseded, it is not activated")
+            return False
+        imported = self.db.session.scalar(select(func.count()).select_from(search_table)
+                                          .where(search_table.c.generation_id == generation_id))
+        if imported > 0:
+            itinerary_table = Itinerary.__table__
+            for search_rowid, itinerary_rowids in (carried or {}).items():
+                for chunk in chunked(itinerary_rowids):
+                    self.db.session.execute(update(itinerary_table).where(itinerary_table.c.rowid.in_(chunk))
+                                            .values(search_id=search_rowid))
+            self.db.session.execute(update(search_table)
+                                    .where(search_table.c.actual.is_(True),
+                                           or_(search_table.c.generation_id.is_(None),
+                                               search_table.c.generation_id != generation_id))
+                                    .values(actual=False))
+            self.db.session.execute(update(search_table).where(search_table.c.generation_id == generation_id)
+                                    .values(actual=True))
+            self.db.session.execute(update(generation_table).where(generation_table.c.active.is_(True))
+                                    .values(active=False))
+            self.rebuild_monthly_top()
+        self.db.session.execute(update(generation_table).where(generation_table.c.rowid == generation_id)
+                                .values(active=imported > 0, finished=datetime.now()))
         self.db.session.commit()
-        self.logger.info(f"Cleared {updated} active searches")
-        return updated
+        if imported > 0:
+            self.logger.info(f"Activated generation {generation_id} with {imported} searches")
+        else:
+            self.logger.warning(f"Generation {generation_id} has no searches, the previous one stays active")
+        return imported > 0
+
+    def rebuild_monthly_top(self)->None:
+        """
+        Replaces the content of monthly_top with the ranking of the actual searches.
+        Nothing is committed, the caller decides which transaction the new ranking belongs to.
+        """
+        with open(MONTHLY_TOP_SQL) as f:
+            ranking = f.read().strip().rstrip(";")
+        # the ranking columns are picked by name, their order in the query does not matter
+        columns = ", ".join(f'"{column.name}"' for column in MonthlyTop.__table__.c)
+        self.db.session.execute(delete(MonthlyTop.__table__))
+        self.db.session.execute(text(f"INSERT INTO monthly_top ({columns}) SELECT {columns} FROM (\n{ranking}\n)"))
 
     def delete_search(self,search:Search)->tuple[int,int,int,int]:
         """
         Deletes the given search and all related itineraries and unused routes from the database.
         """
-        itineraries = list(search.itineraries)
-        itinerary_rowids = [it.rowid for it in itineraries]
-
-        stmt = delete(t_itinerary2route).where(t_itinerary2route.c.itinerary_id.in_(itinerary_rowids))
-        itinerary2route_result = self.db.session.execute(stmt)
+        searches, itineraries, links = self.purge_searches([search.rowid])
+        self.db.session.commit()
+        routes = self.delete_orphan_routes()
+        return searches, itineraries, routes, links
 
-        stmt = delete(Itinerary).where(Itinerary.rowid.in_(itinerary_rowids))
-        itinerary_result = self.db.session.execute(stmt)
+    def purge_searches(self,search_rowids:list[int])->tuple[int,int,int]:
+        """
+        Deletes the given searches with their itineraries, bookings and link rows using set-based statements.
+        Routes are left alone and nothing is committed.
+        """
+        itinerary_table = Itinerary.__table__
+        itinerary_rowids = select(itinerary_table.c.rowid).where(itinerary_table.c.search_id.in_(search_rowids))
+        link_result = self.db.session.execute(
+            delete(t_itinerary2route).where(t_itinerary2route.c.itinerary_id.in_(itinerary_rowids)))
+        self.db.session.execute(
+            delete(Booking.__table__).where(Booking.__table__.c.itinerary_id.in_(itinerary_rowids)))
+        itinerary_result = self.db.session.execute(
+            delete(itinerary_table).where(itinerary_table.c.search_id.in_(search_rowids)))
+        search_result = self.db.session.execute(
+            delete(Search.__table__).where(Search.__table__.c.rowid.in_(search_rowids)))
+        return search_result.rowcount, itinerary_result.rowcount, link_result.rowcount
 
-        stmt = delete(Route).where(
-            ~exists(
-                select(1).where(
-                    t_itinerary2route.c.route_id == Route.rowid
-                )
-            )
-        )
-        route_result = self.db.session.execute(stmt)
+    def delete_orphan_routes(self,chunk_size:int=ROUTE_SWEEP_CHUNK)->int:
+        """
+        Deletes the routes no itinerary refers to. The route table is swept in rowid ranges with a
+        commit after each, so readers are never locked out for the whole sweep.
+        """
+        route_table = Route.__table__
+        max_rowid = self.db.session.scalar(select(func.max(route_table.c.rowid))) or 0
+        deleted = 0
+        for low in range(0, max_rowid + 1, chunk_size):
+            result = self.db.session.execute(delete(route_table).where(
+                route_table.c.rowid.between(low, low + chunk_size - 1),
+                ~exists(select(1).where(t_itinerary2route.c.route_id == route_table.c.rowid))))
+            self.db.session.commit()
+            deleted += result.rowcount
+        return deleted
 
-        self.db.session.delete(search)
+    def delete_empty_generations(self)->None:
+        """
+        Deletes the inactive generations without searches, finished or stale, with their jobs and
+        the raw responses their jobs left in the spool.
+        """
+        generation_table = Generation.__table__
+        job_table = ScanJob.__table__
+        generation_rowids = self.db.session.scalars(select(generation_table.c.rowid).where(
+            generation_table.c.active.is_(False),
+            or_(generation_table.c.finished.isnot(None),
+                generation_table.c.started < datetime.now() - GENERATION_STALE_AFTER),
+            ~exists(select(1).where(Search.__table__.c.generation_id == generation_table.c.rowid)))).all()
+        spool_dir = current_app.config["SCAN_SPOOL_DIR"]
+        for chunk in chunked(generation_rowids):
+            for job_rowid in self.db.session.scalars(select(job_table.c.rowid)
+                                                     .where(job_table.c.generation_id.in_(chunk))):
+                # the spooled response and the part files of killed downloads
+                for path in glob.glob(os.path.join(glob.escape(spool_dir), f"{job_rowid}.*")):
+                    remove_file(path)
+            self.db.session.execute(delete(job_table).where(job_table.c.generation_id.in_(chunk)))
+            self.db.session.execute(delete(generation_table).where(generation_table.c.rowid.in_(chunk)))
         self.db.session.commit()
-        return 1, itinerary_result.rowcount, route_result.rowcount, itinerary2route_result.rowcount
 
+    @staticmethod
+    def reclaimable_searches()->Select:
+        """
+        Selects the not actual searches that can be deleted: the ones of finished generations, the ones
+        without a generation and the ones of scans that died GENERATION_STALE_AFTER ago. The generation
+        of a running scan is never touched.
+        """
+        search_table = Search.__table__
+        generation_table = Generation.__table__
+        return (select(search_table.c.rowid)
+                .select_from(search_table.outerjoin(generation_table,
+                                                    search_table.c.generation_id == generation_table.c.rowid))
+                .where(search_table.c.actual.is_(False),
+                       or_(search_table.c.generation_id.is_(None),
+                           generation_table.c.finished.isnot(None),
+                           generation_table.c.started < datetime.now() - GENERATION_STALE_AFTER)))
 
-    def delete_notactual_searches(self):
-        searches=Search.query.filter_by(actual=0).all()
-        for search in searches:
-            self.delete_search(search)
+    def delete_notactual_searches(self,chunk_size:int=SEARCH_PURGE_CHUNK,
+                                  progress:Callable[[int],None]=None)->tuple[int,int,int,int]:
+        """
+        Purges every reclaimable search with its itineraries, then sweeps the orphan routes and the
+        emptied generations once.
+        Searches are deleted chunk_size at a time, each chunk in its own short transaction.
+        """
+        search_rowids = self.db.session.scalars(self.reclaimable_searches()).all()
+        searches = itineraries = links = 0
+        for chunk in chunked(search_rowids, chunk_size):
+            deleted = self.purge_searches(chunk)
+            self.db.session.commit()
+            searches += deleted[0]
+            itineraries += deleted[1]
+            links += deleted[2]
+            if progress is not None:
+                progress(len(chunk))
+        routes = self.delete_orphan_routes()
+        self.delete_empty_generations()
+        self.logger.info(f"Deleted {searches} searches, {itineraries} itineraries, {routes} routes, {links} links")
+        return searches, itineraries, routes, links
 
 class SearchImporter:
-    def __init__(self):
+    def __init__(self,generation_id:Optional[int]=None):
         self.route_cache = RouteCache()
+        self.generation_id = generation_id
+        self.history = PriceHistory(db.session)
+        # new search rowid -> rowids of actual itineraries it offers unchanged, see BulkSearchImporter.carry_forward
+        self.carried = {}
+        # code -> Place of the ORM importer, code -> place row of the bulk importer
+        self.places = {}
+        # called with the rowid of each imported search before its transaction is committed, see import_month
+        self.checkpoint: Optional[Callable[[int], None]] = None
+
+    def resume_carried(self,carried:dict[int,list[int]])->None:
+        """Takes over the itineraries the imported searches of a resumed scan carried forward."""
+        self.carried.update(carried)
 
     @staticmethod
-    def save_json(json_data:dict, range_start:datetime, save_dir:str)->None:
+    def dump_file_name(range_start:date, save_dir:str, suffix:str=".json", origin:Optional[str]=None)->str:
+        """<timestamp>-<month>[-<origin>]<suffix>, see dump_file_info."""
+        os.makedirs(save_dir,exist_ok=True)
+        origin_part = f"-{origin}" if origin else ""
+        return os.path.join(save_dir,f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{range_start.strftime('%Y%m')}"
+                                     f"{origin_part}{suffix}")
+
+    @staticmethod
+    def save_archive(stream:ResponseStream, fp:BinaryIO, url:str, timestamp:datetime, range_start:date,
+                     range_end:date, save_dir:str, origin:Optional[str]=None)->None:
+        """Compresses the raw response in fp into a DumpArchive, indexed by the header of its stream."""
         if not save_dir:
             return
-        os.makedirs(save_dir,exist_ok=True)
-        file_name = os.path.join(save_dir,f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{range_start.strftime('%Y%m')}.json")
-        with open(file_name, "w", encoding="utf-8") as fo:
-            json.dump(json_data, fo, indent=4, ensure_ascii=False)
+        header = stream.exhaust()
+        index = dict(search_id=header.get("search_id"), url=url, timestamp=timestamp.isoformat(),
+                     range_start=range_start.isoformat(), range_end=range_end.isoformat(),
+                     results=header.get("_results"), currency=header.get("currency"))
+        fp.seek(0)
+        DumpArchive.write(SearchImporter.dump_file_name(range_start, save_dir, ARCHIVE_SUFFIX, origin), index, fp)
 
     @staticmethod
-    def add_itinerary(itinerary:dict)->Itinerary:
+    def itinerary_values(itinerary:dict)->dict:
         local_departure = datetime.strptime(itinerary["local_departure"], KIWI_DATETIME_FORMAT)
         local_arrival = datetime.strptime(itinerary["local_arrival"], KIWI_DATETIME_FORMAT)
         airlines = ','.join(itinerary["airlines"])
-        return Itinerary(itinerary_id=itinerary["id"],
-                                  flyFrom=itinerary["flyFrom"],
-                                  flyTo=itinerary["flyTo"], cityFrom=itinerary["cityFrom"],
-                                  cityCodeFrom=itinerary["cityCodeFrom"], cityTo=itinerary["cityTo"],
-                                  cityCodeTo=itinerary["cityCodeTo"],
-                                  countryFromCode=itinerary["countryFrom"]["code"],
-                                  countryFromName=itinerary["countryFrom"]["name"],
-                                  countryToCode=itinerary["countryTo"]["code"],
-                                  countryToName=itinerary["countryTo"]["name"], local_departure=local_departure,
-                                  local_arrival=local_arrival, nightsInDest=itinerary["nightsInDest"],
-                                  quality=itinerary["quality"], distance=itinerary["distance"],
-                                  durationDeparture=itinerary["duration"]["departure"],
-                                  durationReturn=itinerary["duration"]["return"], price=itinerary["price"],
-                                  conversionEUR=itinerary["conversion"]["EUR"],
-                                  availabilitySeats=itinerary["availability"]["seats"], airlines=airlines,
-                                  booking_token=itinerary["booking_token"], deep_link=itinerary["deep_link"],
-                                  facilitated_booking_available=itinerary["facilitated_booking_available"],
-                                  pnr_count=itinerary["pnr_count"],
-                                  has_airport_change=itinerary["has_airport_change"],
-                                  technical_stops=itinerary["technical_stops"],
-                                  throw_away_ticketing=itinerary["throw_away_ticketing"],
-                                  hidden_city_ticketing=itinerary["hidden_city_ticketing"],
-                                  virtual_interlining=itinerary["virtual_interlining"])
+        return dict(itinerary_id=itinerary["id"], fingerprint=offer_fingerprint(itinerary),
+                    flyFrom=itinerary["flyFrom"],
+                    flyTo=itinerary["flyTo"], local_departure=local_departure,
+                    month=local_departure.strftime("%Y-%m"),
+                    local_arrival=local_arrival, nightsInDest=itinerary["nightsInDest"],
+                    quality=itinerary["quality"], distance=itinerary["distance"],
+                    durationDeparture=itinerary["duration"]["departure"],
+                    durationReturn=itinerary["duration"]["return"], price=itinerary["price"],
+                    conversionEUR=itinerary["conversion"]["EUR"],
+                    availabilitySeats=itinerary["availability"]["seats"], airlines=airlines,
+                    facilitated_booking_available=itinerary["facilitated_booking_available"],
+                    pnr_count=itinerary["pnr_count"],
+                    has_airport_change=itinerary["has_airport_change"],
+                    technical_stops=itinerary["technical_stops"],
+                    throw_away_ticketing=itinerary["throw_away_ticketing"],
+                    hidden_city_ticketing=itinerary["hidden_city_ticketing"],
+                    virtual_interlining=itinerary["virtual_interlining"])
 
+    @staticmethod
+    def place_values(itinerary:dict)->list[dict]:
+        """Returns the place rows of the departure and destination airports of an itinerary."""
+        return [dict(code=itinerary["flyFrom"], city=itinerary["cityFrom"], cityCode=itinerary["cityCodeFrom"],
+                     countryCode=itinerary["countryFrom"]["code"], countryName=itinerary["countryFrom"]["name"]),
+                dict(code=itinerary["flyTo"], city=itinerary["cityTo"], cityCode=itinerary["cityCodeTo"],
+                     countryCode=itinerary["countryTo"]["code"], countryName=itinerary["countryTo"]["name"])]
 
-    def add_route(self,parent_itinerary:Itinerary, route:dict)->bool:
+    @staticmethod
+    def booking_values(itinerary:dict)->dict:
+        return dict(booking_token=itinerary["booking_token"], deep_link=itinerary["deep_link"])
+
+    @staticmethod
+    def route_values(route:dict)->dict:
         local_departure = datetime.strptime(route["local_departure"], KIWI_DATETIME_FORMAT)
         local_arrival = datetime.strptime(route["local_arrival"], KIWI_DATETIME_FORMAT)
-        new_route = Route(route_id=route["id"], combination_id=route["combination_id"], flyFrom=route["flyFrom"],
-                          flyTo=route["flyTo"], cityFrom=route["cityFrom"], cityCodeFrom=route["cityCodeFrom"],
-                          cityTo=route["cityTo"], cityCodeTo=route["cityCodeTo"], local_departure=local_departure,
-                          local_arrival=local_arrival, airline=route["airline"], flight_no=route["flight_no"],
-                          operating_carrier=route["operating_carrier"],
-                          operating_flight_no=route["operating_flight_no"],
-                          fare_basis=route["fare_basis"], fare_category=route["fare_category"],
-                          fare_classes=route["fare_classes"], _return=route["return"],
-                          bags_recheck_required=route["bags_recheck_required"],
-                          vi_connection=route["vi_connection"],
-                          guarantee=route["guarantee"], equipment=route["equipment"],
-                          vehicle_type=route["vehicle_type"])
-        if route["return"] == 1:
+        return dict(route_id=route["id"], combination_id=route["combination_id"], flyFrom=route["flyFrom"],
+                    flyTo=route["flyTo"], cityFrom=route["cityFrom"], cityCodeFrom=route["cityCodeFrom"],
+                    cityTo=route["cityTo"], cityCodeTo=route["cityCodeTo"], local_departure=local_departure,
+                    local_arrival=local_arrival, airline=route["airline"], flight_no=route["flight_no"],
+                    operating_carrier=route["operating_carrier"],
+                    operating_flight_no=route["operating_flight_no"],
+                    fare_basis=route["fare_basis"], fare_category=route["fare_category"],
+                    fare_classes=route["fare_classes"], _return=route["return"],
+                    bags_recheck_required=route["bags_recheck_required"],
+                    vi_connection=route["vi_connection"],
+                    guarantee=route["guarantee"], equipment=route["equipment"],
+                    vehicle_type=route["vehicle_type"])
+
+    def add_itinerary(self,itinerary:dict)->Itinerary:
+        for place in self.place_values(itinerary):
+            self.add_place(place)
+        new_itinerary = Itinerary(**self.itinerary_values(itinerary))
+        new_itinerary.booking = Booking(**self.booking_values(itinerary))
+        return new_itinerary
+
+    def add_place(self,values:dict)->None:
+        """Adds an unknown place, or refreshes the names of a known one."""
+        place = self.places.get(values["code"]) or db.session.get(Place, values["code"])
+        if place is None:
+            place = Place(**values)
+            db.session.add(place)
+        else:
+            for key, value in values.items():
+                if getattr(place, key) != value:
+                    setattr(place, key, value)
+        self.places[values["code"]] = place
+
+    def add_route(self,parent_itinerary:Itinerary, route:dict)->bool:
+        new_route = Route(**self.route_values(route))
+        if new_route._return == 1:
             if parent_itinerary.rlocal_departure is None:
-                parent_itinerary.rlocal_departure = local_departure
-            parent_itinerary.rlocal_arrival = local_arrival
+                parent_itinerary.rlocal_departure = new_route.local_departure
+            parent_itinerary.rlocal_arrival = new_route.local_arrival
         old_route=self.route_cache.get_route(new_route.route_id)
         if old_route is None:
             parent_itinerary.routes.append(new_route)
@@ -169,83 +445,844 @@ class SearchImporter:
             timestamp=datetime.now()
         new_search = Search(search_id=json_data["search_id"], url=url, timestamp=timestamp,
                                 results=json_data["_results"], range_start=range_start, range_end=range_end, actual=actual,
+                            generation_id=self.generation_id,
                             currency=json_data["currency"], fx_rate=json_data["fx_rate"])
         db.session.add(new_search)
 
-        for itinerary in json_data['data']:
-            new_itinerary=self.add_itinerary(itinerary)
-            new_search.itineraries.append(new_itinerary)
-            for route in itinerary['route']:
-                self.add_route(new_itinerary, route)
-        db.session.commit()
+        with timer("build"):
+            self.route_cache.preload({route["id"] for itinerary in json_data['data'] for route in itinerary['route']})
+            for itinerary in json_data['data']:
+                new_itinerary=self.add_itinerary(itinerary)
+                new_search.itineraries.append(new_itinerary)
+                for route in itinerary['route']:
+                    self.add_route(new_itinerary, route)
+        with timer("history"):
+            observations = {}
+            for itinerary in json_data['data']:
+                add_observation(observations, observation_values(itinerary))
+            self.history.record(timestamp, observations, range_start, range_end)
+        with timer("flush"):
+            db.session.flush()
+        if self.checkpoint is not None:
+            self.checkpoint(new_search.rowid)
+        with timer("commit"):
+            db.session.commit()
         return True
 
 
-@click.command('scan',short_help='Scanning flights for next 12 months')
-@with_appcontext
-def scan():
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    os.chdir(project_root)
-    current_app.logger.info("Start")
-    kiwi = Tequila(current_app.config["APIKEY"])
-    range_start = datetime.now().date()
-    db_utils=DbUtils(db,current_app.logger)
-    db_utils.clear_active()
-    importer=SearchImporter()
-    for _ in range(13):
-        range_end = range_start + relativedelta(months=1, day=1, days=-1)
-        max_trying = 10
-        attempt = 0
-        while max_trying>0:
-            max_trying -= 1
-            attempt += 1
-            current_app.logger.info("Search attempt %d for %s", attempt, range_start)
+    def insert_stream(self,stream: ResponseStream, url: str = "", timestamp: datetime = None, range_start: date = None,
+                        range_end: date = None,actual:bool=True)->bool:
+        """Imports a raw response. The ORM importer needs the whole response, so it is loaded at once."""
+        with timer("json_parse"):
+            data = list(stream)
+        return self.insert_json(dict(stream.header, data=data), url, timestamp, range_start, range_end, actual)
+
+
+class BulkSearchImporter(SearchImporter):
+    """
+    Imports a Kiwi response with batched Core statements instead of ORM objects.
+
+    The response is turned into plain column dicts and written with one executemany per table and
+    batch, routes are reconciled against the route table once per batch. insert_stream reads a raw
+    response incrementally, so memory is bounded by a batch instead of the whole response.
+    """
+    def __init__(self,generation_id:Optional[int]=None,incremental:bool=False):
+        super().__init__(generation_id)
+        self.incremental = incremental
+        self.rows_written = 0
+        self.rows_carried = 0
+        self.carried_rowids = set()
+
+    def resume_carried(self,carried:dict[int,list[int]])->None:
+        super().resume_carried(carried)
+        for itinerary_rowids in carried.values():
+            self.carried_rowids.update(itinerary_rowids)
+
+    def upsert_places(self,places:dict[str,dict])->None:
+        """Writes the places that are new or changed since this importer last wrote them."""
+        changed = [row for code, row in places.items() if self.places.get(code) != row]
+        if not changed:
+            return
+        statement = sqlite_insert(Place.__table__)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[Place.__table__.c.code],
+            set_={name: statement.excluded[name] for name in PLACE_UPDATE_COLUMNS}), changed)
+        self.places.update((row["code"], row) for row in changed)
+
+    def upsert_routes(self,routes:dict[str,dict])->dict[str,int]:
+        """
+        Reconciles the routes of a response with the route table and returns a route_id -> rowid map.
+
+        Existing routes are fetched with chunked IN queries, new ones are inserted and only the routes
+        whose columns differ from the stored row are updated, each with a single executemany. A route another
+        writer inserted meanwhile is left as it is, its rowid is selected with the new ones.
+        """
+        route_table = Route.__table__
+        route_rowids = {}
+        stored = {}
+        for chunk in chunked(list(routes)):
+            rows = db.session.execute(select(route_table.c.route_id, route_table.c.rowid,
+                                             *[route_table.c[name] for name in ROUTE_UPDATE_COLUMNS])
+                                      .where(route_table.c.route_id.in_(chunk)))
+            for route_id, rowid, *values in rows:
+                route_rowids[route_id] = rowid
+                stored[route_id] = tuple(values)
+
+        new_routes = [row for route_id, row in routes.items() if route_id not in stored]
+        changed_routes = [{"b_rowid": route_rowids[route_id], **{name: row[name] for name in ROUTE_UPDATE_COLUMNS}}
+                          for route_id, row in routes.items()
+                          if route_id in stored and tuple(row[name] for name in ROUTE_UPDATE_COLUMNS) != stored[route_id]]
+
+        if changed_routes:
+            db.session.execute(update(route_table)
+                               .where(route_table.c.rowid == bindparam("b_rowid"))
+                               .values({name: bindparam(name) for name in ROUTE_UPDATE_COLUMNS}),
+                               changed_routes)
+        for chunk in chunked(new_routes):
+            db.session.execute(sqlite_insert(route_table).on_conflict_do_nothing(index_elements=["route_id"]), chunk)
+            rows = db.session.execute(select(route_table.c.route_id, route_table.c.rowid)
+                                      .where(route_table.c.route_id.in_([row["route_id"] for row in chunk])))
+            route_rowids.update(rows.all())
+        return route_rowids
+
+    def insert_json(self,json_data: dict, url: str = "", timestamp: datetime = None, range_start: date = None,
+                        range_end: date = None,actual:bool=True)->bool:
+        if json_data['_results'] == 0:
+            return False
+        header = {key: value for key, value in json_data.items() if key != 'data'}
+        return self.insert_itineraries(header, json_data['data'], url, timestamp, range_start, range_end, actual)
+
+    def insert_stream(self,stream: ResponseStream, url: str = "", timestamp: datetime = None, range_start: date = None,
+                        range_end: date = None,actual:bool=True)->bool:
+        return self.insert_itineraries(stream.header, stream, url, timestamp, range_start, range_end, actual)
+
+    def insert_itineraries(self, header: dict, itineraries: Iterable[dict], url: str, timestamp: Optional[datetime],
+                           range_start: date, range_end: date, actual: bool) -> bool:
+        def batches() -> Iterator[RowBatch]:
+            for batch in timed_iter("json_parse", chunked(itineraries)):
+                with timer("build"):
+                    rows = self.batch_rows(batch)
+                yield rows
+        return self.insert_rows(header, batches(), url, timestamp, range_start, range_end, actual)
+
+    def insert_rows(self, header: dict, batches: Iterable[RowBatch], url: str = "", timestamp: datetime = None,
+                    range_start: date = None, range_end: date = None, actual: bool = True) -> bool:
+        """
+        Writes the row batches of one response and commits them.
+
+        The search row is created with the first batch. When header is filled by a ResponseStream,
+        the fields preceding "data" are known by then; if they are not, batches are held back until
+        the whole response was read.
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+        search_rowid = None
+        pending = []
+        origins = set()
+        inserted = 0
+
+        def write_pending() -> int:
+            written = 0
+            for *rows, batch_observations in pending:
+                written += self.write_rows(search_rowid, *rows)
+                # the history is written batch by batch, only the origins are kept for withdraw
+                with timer("history"):
+                    self.history.observe(timestamp, batch_observations)
+                origins.update(values["flyFrom"] for values in batch_observations.values())
+            pending.clear()
+            return written
+
+        for batch in batches:
+            pending.append(batch)
+            if "search_id" not in header:
+                continue
+            if search_rowid is None:
+                search_rowid = self.insert_search(header, url, timestamp, range_start, range_end, actual)
+                if search_rowid is None:
+                    return False
+            inserted += write_pending()
+        if search_rowid is None:
+            if not pending:
+                return False
+            search_rowid = self.insert_search(header, url, timestamp, range_start, range_end, actual)
+            if search_rowid is None:
+                return False
+        inserted += write_pending()
+        with timer("history"):
+            self.history.withdraw(timestamp, origins, range_start, range_end)
+        # _results may only have been read after the data array
+        with timer("commit"):
+            db.session.execute(update(Search.__table__).where(Search.__table__.c.rowid == search_rowid)
+                               .values(results=header.get("_results", inserted)))
+            if self.checkpoint is not None:
+                self.checkpoint(search_rowid)
+            db.session.commit()
+        return True
+
+    def insert_search(self, header: dict, url: str, timestamp: Optional[datetime], range_start: date, range_end: date,
+                      actual: bool) -> Optional[int]:
+        """Inserts the search row and returns its rowid, or None if the search was imported before."""
+        old_search=db.session.execute(select(Search.rowid).filter_by(search_id=header["search_id"])).first()
+        if old_search is not None:
+            return None
+        if timestamp is None:
+            timestamp=datetime.now()
+        search_result = db.session.execute(insert(Search.__table__).values(
+            search_id=header["search_id"], url=url, timestamp=timestamp, results=header.get("_results", 0),
+            range_start=range_start, range_end=range_end, actual=actual, generation_id=self.generation_id,
+            currency=header["currency"], fx_rate=header["fx_rate"]))
+        return search_result.inserted_primary_key[0]
+
+    @staticmethod
+    def batch_rows(batch: list[dict]) -> RowBatch:
+        """
+        Converts itineraries into itinerary rows, route rows keyed by route_id, (itinerary_id, route_id) links,
+        place rows, booking rows and price observations. Needs no database, so it can run in a worker process.
+        """
+        itineraries = []
+        routes = {}
+        links = []
+        places = {}
+        bookings = {}
+        observations = {}
+        for itinerary in batch:
+            add_observation(observations, observation_values(itinerary))
+            itinerary_row = SearchImporter.itinerary_values(itinerary)
+            places.update((place["code"], place) for place in SearchImporter.place_values(itinerary))
+            bookings[itinerary_row["itinerary_id"]] = SearchImporter.booking_values(itinerary)
+            itinerary_row.update(rlocal_departure=None, rlocal_arrival=None)
+            for route in itinerary['route']:
+                route_row = SearchImporter.route_values(route)
+                if route_row["_return"] == 1:
+                    if itinerary_row["rlocal_departure"] is None:
+                        itinerary_row["rlocal_departure"] = route_row["local_departure"]
+                    itinerary_row["rlocal_arrival"] = route_row["local_arrival"]
+                if route_row["route_id"] in routes:
+                    first_row = routes[route_row["route_id"]]
+                    route_row.update(local_departure=first_row["local_departure"],
+                                     local_arrival=first_row["local_arrival"])
+                routes[route_row["route_id"]] = route_row
+                links.append((itinerary_row["itinerary_id"], route_row["route_id"]))
+            itineraries.append(itinerary_row)
+        return itineraries, routes, links, places, bookings, observations
+
+    def write_rows(self, search_rowid: int, itineraries: list[dict], routes: dict[str, dict],
+                   links: list[tuple[str, str]], places: dict[str, dict], bookings: dict[str, dict]) -> int:
+        """Writes one row batch of the given search and returns the number of itineraries."""
+        offered = len(itineraries)
+        if self.incremental:
+            with timer("carry"):
+                itineraries, routes, links, bookings = self.carry_forward(search_rowid, itineraries, routes, links,
+                                                                          bookings)
+        with timer("write"):
+            self.write_batch(search_rowid, itineraries, routes, links, places, bookings)
+        return offered
+
+    def carry_forward(self, search_rowid: int, itineraries: list[dict], routes: dict[str, dict],
+                      links: list[tuple[str, str]], bookings: dict[str, dict]
+                      ) -> tuple[list[dict], dict[str, dict], list[tuple[str, str]], dict[str, dict]]:
+        """
+        Drops the itineraries of a batch that an actual search offers with the same fingerprint and returns the
+        rows left to insert. The stored rows are kept in carried, activate_generation moves them to the new
+        search; until then the actual searches keep them. Only their booking token and deep link are refreshed,
+        Kiwi tokens expire.
+        """
+        itinerary_table = Itinerary.__table__
+        search_table = Search.__table__
+        stored = {}
+        for chunk in chunked(list({row["fingerprint"] for row in itineraries})):
+            rows = db.session.execute(select(itinerary_table.c.fingerprint, itinerary_table.c.rowid)
+                                      .join(search_table, search_table.c.rowid == itinerary_table.c.search_id)
+                                      .where(search_table.c.actual.is_(True),
+                                             itinerary_table.c.fingerprint.in_(chunk)))
+            for fingerprint, rowid in rows:
+                if rowid not in self.carried_rowids:
+                    stored.setdefault(fingerprint, []).append(rowid)
+        carried = self.carried.setdefault(search_rowid, [])
+        kept = []
+        refreshed = []
+        for row in itineraries:
+            if stored.get(row["fingerprint"]):
+                rowid = stored[row["fingerprint"]].pop()
+                carried.append(rowid)
+                self.carried_rowids.add(rowid)
+                refreshed.append(dict(bookings[row["itinerary_id"]], b_itinerary_id=rowid))
+            else:
+                kept.append(row)
+        if refreshed:
+            booking_table = Booking.__table__
+            db.session.execute(update(booking_table)
+                               .where(booking_table.c.itinerary_id == bindparam("b_itinerary_id"))
+                               .values(booking_token=bindparam("booking_token"), deep_link=bindparam("deep_link")),
+                               refreshed)
+        self.rows_carried += len(refreshed)
+        kept_ids = {row["itinerary_id"] for row in kept}
+        links = [link for link in links if link[0] in kept_ids]
+        linked = {route_id for _, route_id in links}
+        return (kept, {route_id: row for route_id, row in routes.items() if route_id in linked}, links,
+                {itinerary_id: row for itinerary_id, row in bookings.items() if itinerary_id in kept_ids})
+
+    def write_batch(self, search_rowid: int, itineraries: list[dict], routes: dict[str, dict],
+                    links: list[tuple[str, str]], places: dict[str, dict], bookings: dict[str, dict]) -> None:
+        itinerary_table = Itinerary.__table__
+        self.upsert_places(places)
+        if not itineraries:
+            return
+        for itinerary_row in itineraries:
+            itinerary_row["search_id"] = search_rowid
+        db.session.execute(insert(itinerary_table), itineraries)
+        itinerary_rowids = dict(db.session.execute(
+            select(itinerary_table.c.itinerary_id, itinerary_table.c.rowid)
+            .where(itinerary_table.c.search_id == search_rowid,
+                   itinerary_table.c.itinerary_id.in_([row["itinerary_id"] for row in itineraries]))).all())
+        db.session.execute(insert(Booking.__table__),
+                           [dict(values, itinerary_id=itinerary_rowids[itinerary_id])
+                            for itinerary_id, values in bookings.items()])
+        route_rowids = self.upsert_routes(routes)
+
+        link_rows = [{"itinerary_id": itinerary_rowids[itinerary_id], "route_id": route_rowids[route_id]}
+                     for itinerary_id, route_id in links]
+        for chunk in chunked(link_rows):
+            db.session.execute(sqlite_insert(t_itinerary2route).on_conflict_do_nothing(), chunk)
+        self.rows_written += len(itineraries) + len(bookings) + len(routes) + len(link_rows)
+
+
+def make_importer(orm:bool, generation_id:Optional[int]=None, incremental:bool=False)->SearchImporter:
+    return SearchImporter(generation_id) if orm else BulkSearchImporter(generation_id, incremental)
+
+def make_queue()->ScanQueue:
+    return ScanQueue(db.session, timedelta(seconds=current_app.config["SCAN_JOB_LEASE"]),
+                     current_app.config["SCAN_JOB_ATTEMPTS"])
+
+def spool_file(spool_dir:str, job_rowid:int)->str:
+    """The file the raw response of a scan job is kept in until it is imported."""
+    return os.path.join(spool_dir, f"{job_rowid}.json")
+
+def part_file(spool_dir:str, job_rowid:int, owner:str)->str:
+    """
+    The file a worker downloads the response of a job into. Each owner has its own, a worker whose lease
+    expired may still be downloading when the job's new worker starts.
+    """
+    return os.path.join(spool_dir, f"{job_rowid}.{re.sub(r'[^A-Za-z0-9_-]', '_', owner)}.part")
+
+def remove_file(path:str)->None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def download_job(kiwi:Tequila, job, path:str, logger:Logger)->SearchResponse:
+    """
+    Downloads the response of a leased scan job into path, the part file of its worker. The caller moves it
+    into the spool once the job is checkpointed as fetched, and deletes it otherwise.
+    Runs on a worker thread, so it must not touch the database session.
+    """
+    logger.info("Search attempt %d for %s %s", job.attempts, job.fly_from, job.range_start)
+    with open(path, "wb") as fo, timer("kiwi_fetch"):
+        return kiwi.download(fo,job.fly_from,job.range_start,job.range_end,nights_in_dst_from=job.nights_from,
+                             nights_in_dst_to=job.nights_to,limit=1000)
+
+class QueueWorker:
+    """
+    Drains the scan queue: the leased jobs are downloaded on worker threads and imported on the calling thread,
+    the only one that writes. A generation is activated when its last job is imported or failed, by whichever
+    worker finishes it.
+    """
+    def __init__(self,queue:ScanQueue,db_utils:DbUtils,kiwi:Tequila,orm:bool,incremental:bool,workers:int,
+                 logger:Logger)->None:
+        self.queue = queue
+        self.db_utils = db_utils
+        self.kiwi = kiwi
+        self.orm = orm
+        self.incremental = incremental
+        self.workers = workers
+        self.logger = logger
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.spool_dir = current_app.config['SCAN_SPOOL_DIR']
+        # generation_id -> importer, the carried itineraries of its jobs imported by any worker are taken over
+        self.importers = {}
+        self.activated = False
+
+    def importer(self,generation_id:int)->SearchImporter:
+        if generation_id not in self.importers:
+            importer = make_importer(self.orm, generation_id, self.incremental)
+            importer.resume_carried(self.queue.carried(generation_id))
+            self.importers[generation_id] = importer
+        return self.importers[generation_id]
+
+    def run(self)->None:
+        """Works until no job is left to lease, waiting for its backoff or for the lease of another worker."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        in_flight = {}
+        renewed = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                for job in self.queue.lease(self.owner, self.workers - len(in_flight)):
+                    path = spool_file(self.spool_dir, job.rowid)
+                    if os.path.exists(path):
+                        # downloaded completely before the worker that leased it died
+                        self.import_job(job, job.url or current_app.config["KIWI_URL"])
+                    else:
+                        partial = part_file(self.spool_dir, job.rowid, self.owner)
+                        in_flight[executor.submit(download_job, self.kiwi, job, partial, self.logger)] = job
+                if not in_flight:
+                    self.finish_generations()
+                    if not self.queue.waiting(self.owner):
+                        break
+                    time.sleep(QUEUE_POLL)
+                    continue
+                # time the importer waits for Kiwi, the downloads themselves are kiwi_fetch
+                with timer("kiwi_wait"):
+                    done, _ = wait(in_flight, timeout=QUEUE_POLL, return_when=FIRST_COMPLETED)
+                if time.monotonic() - renewed > self.queue.lease_time.total_seconds() / 3:
+                    self.queue.renew(self.owner)
+                    renewed = time.monotonic()
+                for future in done:
+                    self.handle(in_flight.pop(future), future)
+                self.finish_generations()
+
+    def handle(self,job,future:Future)->None:
+        partial = part_file(self.spool_dir, job.rowid, self.owner)
+        try:
             try:
-                result=kiwi.search("BUD",range_start,range_end,nights_in_dst_from=2,nights_in_dst_to=3,limit=1000)
+                response = future.result()
             except Exception as ex:
-                current_app.logger.exception("Kiwi Error:")
-                current_app.logger.debug("Kiwi response status: %s", getattr(kiwi, "status_code", None))
-                time.sleep(min(5 * attempt, 30))
+                self.logger.exception("Kiwi Error:")
+                self.retry(job, f"Kiwi error: {ex}")
+                return
+            if response.status_code!=200:
+                self.logger.debug("Kiwi response status: %s", response.status_code)
+                self.retry(job, f"Kiwi response status: {response.status_code}")
+                return
+            if not self.queue.fetched(job, response.url):
+                self.lost(job)
+                return
+            # the spool only ever holds whole responses of the job's current worker
+            os.replace(partial, spool_file(self.spool_dir, job.rowid))
+        finally:
+            remove_file(partial)
+        self.import_job(job, response.url)
+
+    def retry(self,job,error:str)->Optional[str]:
+        state = self.queue.retry(job, error)
+        if state is None:
+            self.lost(job)
+        elif state == ScanJob.FAILED:
+            self.logger.error("Giving up on %s %s after %d attempts", job.fly_from, job.range_start, job.attempts)
+        return state
+
+    def lost(self,job)->None:
+        self.logger.warning("The lease of %s %s expired and was taken over, its result is dropped",
+                            job.fly_from, job.range_start)
+
+    def import_job(self,job,url:str)->None:
+        try:
+            self.import_response(job, url)
+        except LeaseLost:
+            # the spool file now belongs to the job's new worker
+            db.session.rollback()
+            self.importers.pop(job.generation_id, None)
+            self.lost(job)
+        except Exception as ex:
+            db.session.rollback()
+            self.logger.exception("Import Error:")
+            # the importer remembers what it wrote, the rolled back rows are written again by a new one
+            self.importers.pop(job.generation_id, None)
+            if self.retry(job, f"Import error: {ex}") is not None:
+                remove_file(spool_file(self.spool_dir, job.rowid))
+        else:
+            self.release_spool(job)
+
+    def import_response(self,job,url:str)->None:
+        """
+        Imports the spooled response of a job, checkpointed as imported in the same transaction,
+        then writes it to SAVEDIR as a dump archive if that is the SAVE_FORMAT.
+        """
+        save_dir = current_app.config['SAVEDIR']
+        path = spool_file(self.spool_dir, job.rowid)
+        importer = self.importer(job.generation_id)
+
+        def checkpoint(search_rowid:int)->None:
+            self.queue.imported(job, url, search_rowid, importer.carried.get(search_rowid))
+
+        timestamp = datetime.now()
+        importer.checkpoint = checkpoint
+        try:
+            with open(path, "rb") as fo:
+                stream = ResponseStream(fo)
+                imported = importer.insert_stream(stream, url, timestamp, range_start=job.range_start,
+                                                  range_end=job.range_end, actual=False)
+                if not imported:
+                    # no itineraries in the window
+                    self.queue.imported(job, url)
+                    db.session.commit()
+                if current_app.config['SAVE_FORMAT'] == "archive":
+                    # the job is imported, an archive that cannot be written is only missing from SAVEDIR
+                    try:
+                        with timer("archive"):
+                            importer.save_archive(stream, fo, url, timestamp, job.range_start, job.range_end,
+                                                  save_dir, job.fly_from)
+                    except Exception:
+                        self.logger.exception("Could not archive the response of %s %s:", job.fly_from,
+                                              job.range_start)
+        finally:
+            importer.checkpoint = None
+
+    def release_spool(self,job)->None:
+        """Moves the spooled response of an imported job to SAVEDIR if SAVE_FORMAT is json, or deletes it."""
+        save_dir = current_app.config['SAVEDIR']
+        path = spool_file(self.spool_dir, job.rowid)
+        try:
+            if save_dir and current_app.config['SAVE_FORMAT'] != "archive":
+                shutil.move(path, SearchImporter.dump_file_name(job.range_start, save_dir, origin=job.fly_from))
             else:
-                importer.save_json(result, range_start,current_app.config['SAVEDIR'])
-                if kiwi.status_code==200:
-                    importer.insert_json(result, kiwi.search_url, datetime.now(),range_start=range_start, range_end=range_end)
-                    break
-        range_start=range_start+relativedelta(months=1,day=1)
+                remove_file(path)
+        except OSError:
+            self.logger.exception("Could not release the spooled response of %s %s:", job.fly_from, job.range_start)
+            remove_file(path)
+
+    def finish_generations(self)->None:
+        for generation_id in self.queue.complete_generations():
+            carried = self.queue.carried(generation_id)
+            if carried:
+                self.logger.info("Carried forward %d unchanged itineraries into generation %d",
+                                 sum(len(rowids) for rowids in carried.values()), generation_id)
+            with timer("activate"):
+                self.activated |= self.db_utils.activate_generation(generation_id, carried)
+            self.importers.pop(generation_id, None)
+
+def queue_scan(resume:bool)->int:
+    """
+    Queues the jobs of a new generation, one per enabled origin and month, and returns it. With resume,
+    the last scan is worked on instead if it died before it was activated, see ScanQueue.reopen.
+    """
+    queue = make_queue()
+    db_utils = DbUtils(db, current_app.logger)
+    generation_id = db_utils.resumable_generation() if resume else None
+    if generation_id is not None:
+        queue.reopen(generation_id)
+        current_app.logger.info("Resuming generation %d, %d searches left", generation_id,
+                                queue.open_jobs(generation_id))
+        return generation_id
+    origins = queue.origins()
+    if not origins:
+        raise click.ClickException("No origin is enabled, add one with flask set_origin")
+    jobs = ScanQueue.plan(origins, datetime.now().date())
+    generation_id = db_utils.start_generation(jobs)
+    current_app.logger.info("Queued %d searches from %s in generation %d", len(jobs),
+                            ",".join(origin.code for origin in origins), generation_id)
+    return generation_id
+
+def run_worker(orm:bool, workers:Optional[int], incremental:bool, source:str)->None:
+    """Drains the scan queue, then warms the page of the activated data and reclaims the old searches."""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(project_root)
+    use_sqlite_role("bulk")
+    workers = max(1, workers or current_app.config["SCAN_WORKERS"])
+    kiwi = Tequila(current_app.config["APIKEY"], current_app.config["KIWI_URL"],
+                   RateLimiter(current_app.config["KIWI_RATE_LIMIT"]), pool_size=workers,
+                   timeout=(current_app.config["KIWI_CONNECT_TIMEOUT"], current_app.config["KIWI_READ_TIMEOUT"]),
+                   retries=current_app.config["KIWI_RETRIES"])
+    db_utils=DbUtils(db,current_app.logger)
+    worker = QueueWorker(make_queue(), db_utils, kiwi, orm, incremental, workers, current_app.logger)
+    worker.run()
+    kiwi.close()
+    current_app.logger.info("Kiwi: %d requests, %d bytes transferred", kiwi.request_count, kiwi.bytes_transferred)
+    if worker.activated:
+        warm_page_cache()
+    # readers already see the new generation, the old one is reclaimed in short transactions
     current_app.logger.info('Cleanup')
-    db_utils.delete_notactual_searches()
+    with timer("cleanup"):
+        db_utils.delete_notactual_searches()
+    report_metrics(source)
     current_app.logger.info("Finished")
 
+@click.command('scan',short_help='Scanning flights for next 12 months')
+@click.option('--orm', is_flag=True, help='Import with the ORM unit-of-work instead of bulk statements')
+@click.option('--workers', type=int, default=None, help='Number of searches fetched concurrently (default: SCAN_WORKERS)')
+@click.option('--incremental', is_flag=True,
+              help='Keep the itineraries the actual searches offer unchanged instead of inserting them again')
+@click.option('--resume', is_flag=True,
+              help='Continue the last scan if it died, only its searches not imported yet are fetched and imported')
+@with_appcontext
+def scan(orm:bool, workers:Optional[int], incremental:bool, resume:bool):
+    """Queues the searches of every enabled origin and works them off in this process, see schedule and worker."""
+    if orm and incremental:
+        raise click.UsageError("--incremental needs the bulk importer, it cannot be combined with --orm")
+    current_app.logger.info("Start")
+    queue_scan(resume)
+    run_worker(orm, workers, incremental, "scan")
+
+@click.command('schedule',short_help='Queue the searches of a new scan for flask worker')
+@click.option('--resume', is_flag=True, help='Keep the last scan instead if it died before it was activated')
+@with_appcontext
+def schedule(resume:bool):
+    queue_scan(resume)
+
+@click.command('worker',short_help='Fetch and import the queued searches until the queue is empty')
+@click.option('--orm', is_flag=True, help='Import with the ORM unit-of-work instead of bulk statements')
+@click.option('--workers', type=int, default=None, help='Number of searches fetched concurrently (default: SCAN_WORKERS)')
+@click.option('--incremental', is_flag=True,
+              help='Keep the itineraries the actual searches offer unchanged instead of inserting them again')
+@with_appcontext
+def worker(orm:bool, workers:Optional[int], incremental:bool):
+    """Several workers can drain the queue at once, each leases its own jobs."""
+    if orm and incremental:
+        raise click.UsageError("--incremental needs the bulk importer, it cannot be combined with --orm")
+    current_app.logger.info("Start")
+    run_worker(orm, workers, incremental, "worker")
+
+@click.command('origins',short_help='List the departure airports of the scans')
+@with_appcontext
+def origins():
+    origin_table = ScanOrigin.__table__
+    for origin in db.session.execute(select(origin_table).order_by(origin_table.c.code)):
+        click.echo(f"{origin.code}  {origin.nights_from}-{origin.nights_to} nights  {origin.months} months"
+                   f"{'' if origin.enabled else '  disabled'}")
+
+@click.command('set_origin',short_help='Add or change a departure airport of the scans')
+@click.argument('code')
+@click.option('--nights-from', type=click.IntRange(0), default=None, help='Minimum nights at the destination (default: 2)')
+@click.option('--nights-to', type=click.IntRange(0), default=None, help='Maximum nights at the destination (default: 3)')
+@click.option('--months', type=click.IntRange(1), default=None, help='Monthly windows searched ahead (default: 13)')
+@click.option('--enable/--disable', 'enabled', default=None, help='Scan the origin or skip it')
+@with_appcontext
+def set_origin(code:str, nights_from:Optional[int], nights_to:Optional[int], months:Optional[int],
+               enabled:Optional[bool]):
+    """The changes apply to the scans scheduled afterwards."""
+    origin_table = ScanOrigin.__table__
+    values = {name: value for name, value in dict(nights_from=nights_from, nights_to=nights_to, months=months,
+                                                  enabled=enabled).items() if value is not None}
+    code = code.upper()
+    statement = sqlite_insert(origin_table).values(code=code, **values)
+    db.session.execute(statement.on_conflict_do_update(index_elements=[origin_table.c.code], set_=values)
+                       if values else statement.on_conflict_do_nothing())
+    origin = db.session.execute(select(origin_table).where(origin_table.c.code == code)).one()
+    if origin.nights_from > origin.nights_to:
+        db.session.rollback()
+        raise click.UsageError(f"--nights-from {origin.nights_from} is more than --nights-to {origin.nights_to}")
+    db.session.commit()
+    click.echo(f"{origin.code}  {origin.nights_from}-{origin.nights_to} nights  {origin.months} months"
+               f"{'' if origin.enabled else '  disabled'}")
+
+def report_metrics(source:str)->None:
+    """Logs the phase timings of the command and keeps them for the /metrics endpoint of the web workers."""
+    log_metrics(current_app.logger, source)
+    save_metrics(current_app.config['METRICS_DIR'], source)
+
+def mirror_page_assets()->None:
+    """Fetches the logos and flags of the page and downloads them into the mirror directory."""
+    codes = longweekend_codes(longweekend_rows())
+    fetched = asset_resolver.fetch_missing(*codes, logger=current_app.logger)
+    mirrored = asset_resolver.mirror_missing(*codes, directory=asset_directory(), logger=current_app.logger)
+    current_app.logger.info(f"Fetched {fetched} logos and flags, mirrored {mirrored}, "
+                            f"store hits: {asset_resolver.hits}, misses: {asset_resolver.misses}")
+
+def warm_page_cache()->None:
+    """
+    Mirrors the logos and flags of the new data and renders its pages,
+    so the first visitor after a scan gets a cached page without waiting for API Ninjas.
+    """
+    try:
+        with timer("asset_mirror"):
+            mirror_page_assets()
+        with timer("warm_page"):
+            warm_longweekend()
+    except Exception:
+        # the page is rendered on the first request instead
+        current_app.logger.exception("Could not warm the page cache")
+
+def dump_file_info(file:str)->tuple[datetime,date,date]:
+    """Returns the scan timestamp and the month range encoded in a dump file name."""
+    timestamp = datetime.strptime(file[:14], "%Y%m%d%H%M%S")
+    range_start = datetime.strptime(file[15:21] + "01", "%Y%m%d").date()
+    range_end = range_start + relativedelta(months=1, days=-1)
+    return timestamp, range_start, range_end
+
+@contextmanager
+def open_dump_file(path:str)->Iterator[tuple[dict,BinaryIO]]:
+    """
+    Opens a legacy .json dump or a dump archive of SAVEDIR.
+    Yields the url, timestamp and range of the search as insert_stream arguments and the raw response body.
+    """
+    file = os.path.basename(path)
+    if file.endswith(ARCHIVE_SUFFIX):
+        with DumpArchive(path) as archive, archive.body() as body:
+            header = archive.header
+            yield dict(url=header["url"], timestamp=datetime.fromisoformat(header["timestamp"]),
+                       range_start=date.fromisoformat(header["range_start"]),
+                       range_end=date.fromisoformat(header["range_end"])), body
+    else:
+        timestamp, range_start, range_end = dump_file_info(file)
+        with open(path, 'rb') as body:
+            yield dict(url="", timestamp=timestamp, range_start=range_start, range_end=range_end), body
+
+def pending_dumps(paths:list[str], manifest:DumpManifest, known:set[str])->list[str]:
+    """
+    Drops the dumps whose search is already imported. Unchanged files are decided by the manifest
+    without opening them, new archives by their index header; only new .json dumps need a parse.
+    """
+    pending = []
+    for path in paths:
+        entry = manifest.lookup(path)
+        if entry is None and path.endswith(ARCHIVE_SUFFIX):
+            with DumpArchive(path) as archive:
+                manifest.record(path, archive.header["search_id"])
+            entry = manifest.lookup(path)
+        if entry is not None and (entry["search_id"] is None or entry["search_id"] in known):
+            continue
+        pending.append(path)
+    return pending
+
+def parse_dump(path: str) -> tuple[dict, dict, list[RowBatch]]:
+    """
+    Parses a dump file into its insert arguments, header and the row batches of BulkSearchImporter.
+    Runs in a worker process of import_jsons, so it must not touch the database.
+    """
+    with open_dump_file(path) as (arguments, body):
+        stream = ResponseStream(body)
+        batches = [BulkSearchImporter.batch_rows(batch) for batch in chunked(stream)]
+    return arguments, stream.header, batches
+
+def parsed_dumps(paths:list[str], workers:int):
+    """Yields (path, parse_dump result) in the order of paths, parsing at most 2 * workers files ahead."""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append((path, executor.submit(parse_dump, path)))
+            if len(pending) >= 2 * workers:
+                path, future = pending.popleft()
+                yield path, future.result()
+        while pending:
+            path, future = pending.popleft()
+            yield path, future.result()
+
+def show_throughput(pbar:tqdm, rows:int)->None:
+    """Adds the row rate to the files/s shown by the progress bar."""
+    elapsed = pbar.format_dict["elapsed"] or 1
+    pbar.set_postfix_str(f"{rows / elapsed:.0f} rows/s", refresh=False)
+
 @click.command('import_jsons',short_help='Reimport all json from tmo folder')
+@click.option('--orm', is_flag=True, help='Import with the ORM unit-of-work instead of bulk statements')
+@click.option('--workers', type=int, default=1, help='Number of processes parsing files in parallel')
 @with_appcontext
-def import_jsons():
+def import_jsons(orm:bool, workers:int):
+    if orm and workers > 1:
+        raise click.UsageError("--workers needs the bulk importer, it cannot be combined with --orm")
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     os.chdir(project_root)
     current_app.logger.info("Start")
-    all_jsons = [f for f in os.listdir(current_app.config['SAVEDIR']) if f.endswith(".json")]
-    pbar = tqdm(all_jsons, desc="Processing json files", unit="file", ncols=100, mininterval=1.0)
-    importer=SearchImporter()
-    for file in pbar:
-        with open(os.path.join(current_app.config['SAVEDIR'],file),'r') as fo:
-            data = json.load(fo)
-            timestamp = datetime.strptime(file[:14], "%Y%m%d%H%M%S")
-            range_start = datetime.strptime(file[15:21] + "01", "%Y%m%d").date()
-            range_end = range_start + relativedelta(months=1, days=-1)
-            importer.insert_json(data, timestamp=timestamp, range_start=range_start, range_end=range_end, actual=False)
+    use_sqlite_role("bulk")
+    save_dir = current_app.config['SAVEDIR']
+    # file names start with the scan timestamp, so this is the order the searches were made
+    all_jsons = sorted(os.path.join(save_dir, f) for f in os.listdir(save_dir)
+                       if f.endswith(".json") or f.endswith(ARCHIVE_SUFFIX))
+    manifest = DumpManifest(save_dir)
+    known = set(db.session.scalars(select(Search.search_id)))
+    paths = pending_dumps(all_jsons, manifest, known)
+    current_app.logger.info("Skipped %d imported files", len(all_jsons) - len(paths))
+    pbar = tqdm(paths, desc="Processing json files", unit="file", ncols=100, mininterval=1.0)
+    importer=make_importer(orm)
+    try:
+        if workers <= 1:
+            for path in pbar:
+                with open_dump_file(path) as (arguments, body):
+                    stream = ResponseStream(body)
+                    importer.insert_stream(stream, actual=False, **arguments)
+                    search_id = stream.header.get("search_id") or stream.exhaust().get("search_id")
+                manifest.record(path, search_id)
+                known.add(search_id)
+                if not orm:
+                    show_throughput(pbar, importer.rows_written)
+        else:
+            # workers parse and convert the files, this process is the only writer and keeps the file order
+            for path, (arguments, header, batches) in timed_iter("json_parse", parsed_dumps(paths, workers)):
+                importer.insert_rows(header, batches, actual=False, **arguments)
+                manifest.record(path, header.get("search_id"))
+                known.add(header.get("search_id"))
+                pbar.update()
+                show_throughput(pbar, importer.rows_written)
+            pbar.close()
+    finally:
+        manifest.save()
+    report_metrics("import_jsons")
     current_app.logger.info("Finished")
 
 @click.command('cleanup', short_help='Delete all not actual searches and related records')
 @with_appcontext
 def cleanup():
     db_utils=DbUtils(db,current_app.logger)
-    searches = Search.query.filter_by(actual=0).all()
-    pbar = tqdm(searches,desc="Delete unused searches", unit="search")
-    for search in pbar:
-        db_utils.delete_search(search)
+    count = db.session.scalar(select(func.count()).select_from(DbUtils.reclaimable_searches().subquery()))
+    with tqdm(total=count, desc="Delete unused searches", unit="search") as pbar, timer("cleanup"):
+        db_utils.delete_notactual_searches(progress=pbar.update)
+    report_metrics("cleanup")
 
-    db_utils.delete_notactual_searches()
+@click.command('rebuild_top', short_help='Rebuild the monthly cheapest table from the actual searches')
+@with_appcontext
+def rebuild_top():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(project_root)
+    db_utils=DbUtils(db,current_app.logger)
+    with timer("activate"):
+        db_utils.rebuild_monthly_top()
+        db.session.commit()
+    current_app.logger.info("monthly_top has %d rows", db.session.scalar(select(func.count()).select_from(MonthlyTop)))
+    warm_page_cache()
+    report_metrics("rebuild_top")
+
+@click.command('mirror_assets', short_help='Download the logos and flags of the page into ASSET_MIRROR_DIR')
+@with_appcontext
+def mirror_assets():
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(project_root)
+    warm_page_cache()
+
+@click.command('check_plans', short_help='Fail if the ranking query scans tables or sorts itinerary rows')
+@click.option('--current', is_flag=True, help='Check the configured database instead of an empty one built from the models')
+@with_appcontext
+def check_plans(current:bool):
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(project_root)
+    with open(MONTHLY_TOP_SQL) as f:
+        ranking = f.read()
+    if current:
+        engine = db.engine
+    else:
+        # without ANALYZE statistics the plan only depends on the schema
+        engine = create_engine("sqlite://")
+        db.metadata.create_all(engine)
+    with engine.connect() as connection:
+        plan = query_plan(connection, ranking)
+    for step in plan:
+        current_app.logger.info("%3d %3d %s", step.id, step.parent, step.detail)
+    problems = plan_problems(plan, RANKING_TABLES, RANKING_COVERED)
+    for problem in problems:
+        current_app.logger.error(problem)
+    if problems:
+        raise click.ClickException(f"The ranking query plan has {len(problems)} problems")
+    current_app.logger.info("The ranking query plan is fine")
+
+@click.command('price_history', short_help='Show the cheapest price to a destination in a month over the scans')
+@click.argument('destination')
+@click.argument('month')
+@click.option('--origin', default=None, help='IATA code of the departure airport (default: all)')
+@with_appcontext
+def price_history(destination:str, month:str, origin:Optional[str]):
+    series = PriceHistory(db.session).cheapest(destination.upper(), month, origin.upper() if origin else None)
+    if not series:
+        current_app.logger.info("No price history to %s in %s", destination, month)
+    for observed, price in series:
+        click.echo(f"{observed:%Y-%m-%d %H:%M}  {'not offered' if price is None else punctuation(price)}")
 
 def register(app):
     app.cli.add_command(scan)
+    app.cli.add_command(schedule)
+    app.cli.add_command(worker)
+    app.cli.add_command(origins)
+    app.cli.add_command(set_origin)
     app.cli.add_command(import_jsons)
     app.cli.add_command(cleanup)
+    app.cli.add_command(rebuild_top)
+    app.cli.add_command(mirror_assets)
+    app.cli.add_command(check_plans)
+    app.cli.add_command(price_history)
@@ -0,0 +1,215 @@
+import hashlib
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Iterable, Optional
+
+from sqlalchemy import select, insert, update, delete, func, and_, bindparam, text, table, column, literal, null
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+
+from common.kiwi import KIWI_DATETIME_FORMAT
+from .models import PriceTrack, PriceChange
+
+# fingerprints per IN query
+CHUNK_SIZE = 500
+# the fingerprints a search offered, from the first batch observed until it is withdrawn
+SEEN_TABLE = table("seen_track", column("fingerprint"))
+
+
+def hash64(value: str) -> int:
+    """Returns a 64-bit hash of value that fits a signed SQLite INTEGER."""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def itinerary_fingerprint(itinerary: dict) -> int:
+    """
+    Returns a stable 64-bit key of the flights of an itinerary. Kiwi itinerary ids change between searches,
+    the legs (airports, flight number and departure) do not.
+    """
+    return hash64("|".join(f'{route["flyFrom"]}-{route["flyTo"]}-{route["airline"]}{route["flight_no"]}-'
+                           f'{route["local_departure"]}' for route in itinerary["route"]))
+
+
+def offer_fingerprint(itinerary: dict) -> int:
+    """Returns a 64-bit key of the flights, price and seats of an itinerary, equal while Kiwi offers it unchanged."""
+    return hash64(f'{itinerary_fingerprint(itinerary)}|{itinerary["price"]}|{itinerary["availability"]["seats"]}')
+
+
+def observation_values(itinerary: dict) -> dict:
+    """Returns the price_track row of an itinerary with the price and seats a search offered it for."""
+    local_departure = datetime.strptime(itinerary["local_departure"], KIWI_DATETIME_FORMAT)
+    returns = [route for route in itinerary["route"] if route["return"] == 1]
+    return dict(fingerprint=itinerary_fingerprint(itinerary), flyFrom=itinerary["flyFrom"],
+                flyTo=itinerary["flyTo"], month=local_departure.strftime("%Y-%m"), local_departure=local_departure,
+                rlocal_departure=datetime.strptime(returns[0]["local_departure"], KIWI_DATETIME_FORMAT)
+                if returns else None,
+                nightsInDest=itinerary["nightsInDest"], airlines=','.join(itinerary["airlines"]),
+                price=itinerary["price"], seats=itinerary["availability"]["seats"])
+
+
+def add_observation(observations: dict[int, dict], values: dict) -> None:
+    """Adds an itinerary to the observations of a search, the same flights offered twice count with the lower price."""
+    previous = observations.get(values["fingerprint"])
+    if previous is None or values["price"] < previous["price"]:
+        observations[values["fingerprint"]] = values
+
+
+class PriceHistory:
+    """
+    Records the prices of every search into price_track and price_history, and answers price-over-time
+    questions. Only changes are written, so the history grows with the number of price changes
+    instead of scans x itineraries, and it outlives the cleanup of the searches.
+
+    Usage:
+        history.record(search.timestamp, observations, search.range_start, search.range_end)
+        # or a batch of the response at a time
+        history.observe(search.timestamp, batch_observations)
+        history.withdraw(search.timestamp, origins, search.range_start, search.range_end)
+        history.cheapest("LHR", "2026-11")   # [(observed, cheapest price or None), ...]
+    """
+
+    def __init__(self, session) -> None:
+        self.session = session
+
+    def latest(self, fingerprints: Iterable[int]) -> dict[int, tuple[datetime, Optional[float], Optional[int]]]:
+        """Returns fingerprint -> (observed, price, seats) of the last recorded row of each known fingerprint."""
+        history = PriceChange.__table__
+        previous = aliased(history)
+        last_observed = (select(func.max(previous.c.observed)).where(previous.c.fingerprint == history.c.fingerprint)
+                         .scalar_subquery())
+        fingerprints = list(fingerprints)
+        latest = {}
+        for start in range(0, len(fingerprints), CHUNK_SIZE):
+            rows = self.session.execute(
+                select(history.c.fingerprint, history.c.observed, history.c.price, history.c.seats)
+                .where(history.c.fingerprint.in_(fingerprints[start:start + CHUNK_SIZE]),
+                       history.c.observed == last_observed))
+            latest.update((fingerprint, (observed, price, seats)) for fingerprint, observed, price, seats in rows)
+        return latest
+
+    def offered(self, origins: Iterable[str], range_start: date, range_end: date) -> set[int]:
+        """Returns the tracks departing in the window whose last row has a price, the ones still offered."""
+        track = PriceTrack.__table__
+        history = PriceChange.__table__
+        previous = aliased(history)
+        last_observed = (select(func.max(previous.c.observed)).where(previous.c.fingerprint == track.c.fingerprint)
+                         .scalar_subquery())
+        return set(self.session.scalars(
+            select(track.c.fingerprint)
+            .select_from(track)
+            .join(history, and_(history.c.fingerprint == track.c.fingerprint, history.c.observed == last_observed))
+            .where(track.c.flyFrom.in_(set(origins)),
+                   track.c.local_departure >= range_start,
+                   track.c.local_departure < range_end + timedelta(days=1),
+                   history.c.price.isnot(None))))
+
+    def record(self, observed: datetime, observations: dict[int, dict], range_start: Optional[date] = None,
+               range_end: Optional[date] = None) -> int:
+        """
+        Records the itineraries a search offered at observed, fingerprint -> observation_values.
+        With the range of the search, the tracks of the window it no longer offers get a NULL price.
+        Observations older than the last recorded one of a track are ignored, the history only moves forward.
+        Returns the number of rows written, nothing is committed.
+        """
+        written = self.observe(observed, observations)
+        return written + self.withdraw(observed, {values["flyFrom"] for values in observations.values()},
+                                       range_start, range_end)
+
+    def observe(self, observed: datetime, observations: dict[int, dict]) -> int:
+        """
+        Records a part of the itineraries a search offered at observed, a batch of a response at a time.
+        The fingerprints are kept in a temporary table until withdraw() is called for the search.
+        An itinerary observed again at the same time keeps the lower price, like add_observation.
+        """
+        if not observations:
+            return 0
+        self.create_seen_table()
+        self.session.execute(sqlite_insert(SEEN_TABLE).on_conflict_do_nothing(),
+                             [{"fingerprint": fingerprint} for fingerprint in observations])
+        latest = self.latest(observations)
+        new_tracks = [{name: values[name] for name in PriceTrack.__table__.c.keys()}
+                      for fingerprint, values in observations.items() if fingerprint not in latest]
+        changes = []
+        lowered = []
+        for fingerprint, values in observations.items():
+            last = latest.get(fingerprint)
+            change = dict(fingerprint=fingerprint, observed=observed, price=values["price"], seats=values["seats"])
+            if last is None or (last[0] < observed and last[1:] != (values["price"], values["seats"])):
+                changes.append(change)
+            elif last[0] == observed and (last[1] is None or values["price"] < last[1]):
+                lowered.append(dict(change, b_fingerprint=fingerprint))
+        if new_tracks:
+            self.session.execute(sqlite_insert(PriceTrack.__table__).on_conflict_do_nothing(), new_tracks)
+        if changes:
+            self.session.execute(insert(PriceChange.__table__), changes)
+        if lowered:
+            history = PriceChange.__table__
+            self.session.execute(update(history)
+                                 .where(history.c.fingerprint == bindparam("b_fingerprint"),
+                                        history.c.observed == observed)
+                                 .values(price=bindparam("price"), seats=bindparam("seats")), lowered)
+        return len(changes)
+
+    def withdraw(self, observed: datetime, origins: Iterable[str], range_start: Optional[date],
+                 range_end: Optional[date]) -> int:
+        """
+        Ends the search observe() was called for: the tracks of origins departing in the window that it did not
+        offer get a NULL price at observed. Without a range nothing is withdrawn. Returns the number of rows written.
+        """
+        self.create_seen_table()
+        origins = set(origins)
+        written = 0
+        if origins and range_start is not None and range_end is not None:
+            track = PriceTrack.__table__
+            history = PriceChange.__table__
+            previous = aliased(history)
+            last_observed = (select(func.max(previous.c.observed)).where(previous.c.fingerprint == track.c.fingerprint)
+                             .scalar_subquery())
+            withdrawn = (select(track.c.fingerprint, literal(observed, history.c.observed.type), null(), null())
+                         .select_from(track)
+                         .join(history, and_(history.c.fingerprint == track.c.fingerprint,
+                                             history.c.observed == last_observed))
+                         .where(track.c.flyFrom.in_(origins),
+                                track.c.local_departure >= range_start,
+                                track.c.local_departure < range_end + timedelta(days=1),
+                                history.c.price.isnot(None),
+                                history.c.observed < observed,
+                                track.c.fingerprint.not_in(select(SEEN_TABLE.c.fingerprint))))
+            written = self.session.execute(insert(history).from_select(
+                ["fingerprint", "observed", "price", "seats"], withdrawn)).rowcount
+        self.session.execute(delete(SEEN_TABLE))
+        return written
+
+    def create_seen_table(self) -> None:
+        # a temporary table belongs to the connection of the session, its rows are rolled back with the import
+        self.session.execute(text("CREATE TEMP TABLE IF NOT EXISTS seen_track (fingerprint INTEGER PRIMARY KEY)"))
+
+    def changes(self, fly_to: str, month: str, fly_from: Optional[str] = None) -> list:
+        """Returns the price_history rows of the tracks to fly_to departing in month ("YYYY-MM"), oldest first."""
+        track = PriceTrack.__table__
+        history = PriceChange.__table__
+        query = (select(history.c.fingerprint, history.c.observed, history.c.price, history.c.seats)
+                 .join(track, track.c.fingerprint == history.c.fingerprint)
+                 .where(track.c.flyTo == fly_to, track.c.month == month)
+                 .order_by(history.c.observed, history.c.fingerprint))
+        if fly_from is not None:
+            query = query.where(track.c.flyFrom == fly_from)
+        return self.session.execute(query).all()
+
+    def cheapest(self, fly_to: str, month: str, fly_from: Optional[str] = None) -> list[tuple[datetime, Optional[float]]]:
+        """
+        Returns the cheapest offered price to fly_to in month after every scan that changed it,
+        None while nothing was offered. The changes of all tracks are replayed in time order.
+        """
+        offered = {}
+        series = []
+        for observed, rows in groupby(self.changes(fly_to, month, fly_from), key=lambda row: row.observed):
+            for row in rows:
+                if row.price is None:
+                    offered.pop(row.fingerprint, None)
+                else:
+                    offered[row.fingerprint] = row.price
+            price = min(offered.values(), default=None)
+            if not series or series[-1][1] != price:
+                series.append((observed, price))
+        return series
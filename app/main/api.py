@@ -0,0 +1,126 @@
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+
+from flask import request, jsonify, stream_with_context, current_app
+from sqlalchemy import select, func, tuple_, union_all, Select
+
+from . import main
+from .. import db
+from ..metrics import timer
+from ..models import Itinerary, Search, Place, Booking, t_itinerary2route
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+# routes of a round trip without a change of planes
+DIRECT_ROUTES = 2
+
+
+def codes(value: str) -> list[str]:
+    return [code.strip().upper() for code in value.split(",") if code.strip()]
+
+
+def parse_cursor(value: str) -> tuple[float, int]:
+    """Returns the (price, rowid) of the last itinerary of the previous page from a "next" value."""
+    price, _, rowid = value.partition(":")
+    return float(price), int(rowid)
+
+
+def itinerary_query(args) -> tuple[Select, int]:
+    """
+    Builds the page query of the actual itineraries from the request arguments and returns it with the page size.
+    The itineraries are ordered by (price, rowid), pages continue after the cursor instead of an OFFSET,
+    so every page is a range read of ix_itinerary_price, ix_itinerary_month_price or
+    ix_itinerary_destination_price. Raises ValueError for invalid arguments.
+    """
+    itinerary = Itinerary.__table__
+    search = Search.__table__
+    booking = Booking.__table__
+    place_from = Place.__table__.alias("place_from")
+    place_to = Place.__table__.alias("place_to")
+    limit = int(args.get("limit", API_PAGE_SIZE))
+    if not 0 < limit <= API_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+
+    query = (select(itinerary.c.rowid.label("id"), itinerary.c.month, itinerary.c.flyFrom, itinerary.c.flyTo,
+                    place_from.c.city.label("cityFrom"), place_to.c.city.label("cityTo"),
+                    place_from.c.countryCode.label("countryFromCode"), place_to.c.countryCode.label("countryToCode"),
+                    itinerary.c.local_departure, itinerary.c.local_arrival, itinerary.c.rlocal_departure,
+                    itinerary.c.rlocal_arrival, itinerary.c.nightsInDest, itinerary.c.durationDeparture,
+                    itinerary.c.durationReturn, itinerary.c.price, search.c.currency, itinerary.c.airlines,
+                    itinerary.c.technical_stops, itinerary.c.availabilitySeats, booking.c.deep_link)
+             .select_from(itinerary)
+             # "+ 0" keeps SQLite from reading the itineraries search by search and sorting them all,
+             # they are read in (price, rowid) order and the actual ones are picked until the page is full
+             .join(search, search.c.rowid == itinerary.c.search_id + 0)
+             .join(booking, booking.c.itinerary_id == itinerary.c.rowid)
+             .join(place_from, place_from.c.code == itinerary.c.flyFrom)
+             .join(place_to, place_to.c.code == itinerary.c.flyTo)
+             .where(search.c.actual.is_(True))
+             .order_by(itinerary.c.price, itinerary.c.rowid)
+             .limit(limit + 1))
+
+    if "month" in args:
+        query = query.where(itinerary.c.month == datetime.strptime(args["month"], "%Y-%m").strftime("%Y-%m"))
+    if "origin" in args:
+        query = query.where(itinerary.c.flyFrom.in_(codes(args["origin"])))
+    if "country" in args:
+        query = query.where(place_to.c.countryCode.in_(codes(args["country"])))
+    if "max_price" in args:
+        query = query.where(itinerary.c.price <= float(args["max_price"]))
+    if "nights" in args:
+        query = query.where(itinerary.c.nightsInDest == int(args["nights"]))
+    if "max_duration" in args:
+        # minutes, of each direction
+        seconds = int(args["max_duration"]) * 60
+        query = query.where(itinerary.c.durationDeparture <= seconds, itinerary.c.durationReturn <= seconds)
+    if args.get("direct", "").lower() in ("1", "true", "yes"):
+        routes = (select(func.count()).select_from(t_itinerary2route)
+                  .where(t_itinerary2route.c.itinerary_id == itinerary.c.rowid).scalar_subquery())
+        query = query.where(itinerary.c.technical_stops == 0, routes <= DIRECT_ROUTES)
+    if "after" in args:
+        query = query.where(tuple_(itinerary.c.price, itinerary.c.rowid) > tuple_(*parse_cursor(args["after"])))
+    destinations = codes(args.get("destination", ""))
+    if len(destinations) == 1:
+        query = query.where(itinerary.c.flyTo == destinations[0])
+    elif destinations:
+        # an IN list sorts every itinerary of the destinations, a page of each one merged reads at most
+        # limit + 1 rows per destination from ix_itinerary_destination_price
+        pages = union_all(*(select(query.where(itinerary.c.flyTo == code).subquery()) for code in destinations))
+        merged = pages.subquery()
+        query = select(merged).order_by(merged.c.price, merged.c.id).limit(limit + 1)
+    return query, limit
+
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_page(rows, limit: int) -> Iterator[str]:
+    """Writes the page as it is read, the cursor of the next page comes last, when it is known."""
+    yield '{"itineraries":['
+    last: Optional[dict] = None
+    next_cursor = None
+    for number, row in enumerate(rows):
+        if number == limit:
+            next_cursor = f"{last['price']}:{last['id']}"
+            break
+        last = {key: json_value(value) for key, value in row.items()}
+        yield ("," if number else "") + json.dumps(last, ensure_ascii=False)
+    yield '],"next":' + json.dumps(next_cursor) + '}'
+
+
+@main.route('/longweekend/api/itineraries')
+def api_itineraries():
+    """
+    The actual itineraries, cheapest first. Filters: month (YYYY-MM), origin, destination and country
+    (comma separated codes), max_price, nights, max_duration (minutes per direction), direct (1).
+    The next page is requested with after=<next of the previous page>.
+    """
+    try:
+        query, limit = itinerary_query(request.args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    with timer("api_query"):
+        rows = db.session.execute(query).mappings()
+    return current_app.response_class(stream_with_context(stream_page(rows, limit)), mimetype="application/json")
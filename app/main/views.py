@@ -1,34 +1,107 @@
-from flask import render_template
-from sqlalchemy import text, func
+import os
+from datetime import datetime, timedelta
+from typing import Optional
 
-from common.apininja import Ninja
+from flask import render_template, current_app, make_response, request, url_for, send_from_directory
+from sqlalchemy import text, func, select
+
+from common.assets import AssetResolver, LOGO_PLACEHOLDER, FLAG_PLACEHOLDER
+from common.pagecache import PageCache
 from config import Config
 from . import main
 from .. import db
-from ..models import Search
+from ..metrics import timer, prometheus_text
+from ..models import Search, Generation
+
+LONGWEEKEND_PAGE = "longweekend"
+# mirrored logos and flags have content hashed names, a name never changes its content
+ASSET_MAX_AGE = timedelta(days=365)
+PLACEHOLDER_MAX_AGE = timedelta(days=1)
+
+asset_resolver = AssetResolver(Config.APININJASKEY, Config.ASSET_STORE)
 
 
 @main.route('/')
 def index():
     return 'Sabai sabai'
 
+def page_version()->tuple[str,Optional[datetime]]:
+    """
+    Returns the cache key and modification time of the data behind the page: the active generation,
+    or the latest actual search for data imported before generations existed.
+    """
+    generation = db.session.execute(select(Generation.rowid, Generation.finished)
+                                    .where(Generation.active.is_(True))
+                                    .order_by(Generation.rowid.desc())).first()
+    if generation is not None:
+        return f"g{generation.rowid}", generation.finished
+    latest_ts = db.session.scalar(select(func.max(Search.timestamp)).where(Search.actual.is_(True)))
+    if latest_ts is None:
+        return "empty", None
+    return f"t{latest_ts:%Y%m%d%H%M%S}", latest_ts
+
+def longweekend_rows()->list:
+    # monthly_top is rebuilt by the scan, reading it does not depend on the number of stored itineraries
+    return db.session.execute(text("SELECT * FROM monthly_top ORDER BY month, price")).mappings().all()
+
+def longweekend_codes(rows:list)->tuple[set[str],set[str]]:
+    """Returns the airline and country codes the page shows images for."""
+    airlines = {row['firstairline'] for row in rows}
+    countries = {row['countryFromCode'] for row in rows} | {row['countryToCode'] for row in rows}
+    return airlines, countries
+
+def asset_directory()->str:
+    """The directory the logos and flags are mirrored into, kept out of the tracked static files."""
+    return os.path.abspath(current_app.config['ASSET_MIRROR_DIR'])
+
+def render_longweekend()->str:
+    with timer("query"):
+        result=longweekend_rows()
+        latest_ts = db.session.query(
+            func.max(Search.timestamp)
+        ).filter(Search.actual.is_(True)).scalar()
+    # codes without a mirrored file get placeholders, the scan mirrors them for the next rendering
+    with timer("asset_lookup"):
+        logo_files, flag_files = asset_resolver.resolve(*longweekend_codes(result))
+        logos = {code: url_for('main.asset', filename=file) for code, file in logo_files.items()}
+        img_resources = {code: url_for('main.asset', filename=file) for code, file in flag_files.items()}
+    with timer("render"):
+        return render_template('index.html',itineraries=result,logos=logos, latest_ts=latest_ts,
+                               img_resources=img_resources)
+
+def warm_longweekend()->None:
+    """Renders the page of the current data into the page cache, called by the CLI after the data changed."""
+    with current_app.test_request_context('/longweekend'):
+        key, _ = page_version()
+        PageCache(current_app.config['PAGE_CACHE_DIR']).replace(LONGWEEKEND_PAGE, key, render_longweekend())
+
+@main.route('/longweekend/assets/<path:filename>')
+def asset(filename):
+    if filename in (LOGO_PLACEHOLDER, FLAG_PLACEHOLDER):
+        return send_from_directory(os.path.join(current_app.static_folder, "logos"), filename,
+                                   max_age=int(PLACEHOLDER_MAX_AGE.total_seconds()))
+    return send_from_directory(asset_directory(), filename, max_age=int(ASSET_MAX_AGE.total_seconds()))
+
 @main.route('/longweekend')
 def longweekend():
-    logos = {}
-    img_resources={}
-    apininja=Ninja(Config.APININJASKEY)
-    with open("sql/monthly_5_cheapest.sql") as f:
-        sql = text(f.read())
-    result=db.session.execute(sql).mappings().all()
-    for row in result:
-        l=apininja.get_airline_logos(row['firstairline'])
-        logos[row['firstairline']]=l['logo_url']
-        l=apininja.get_flag(row['countryFromCode'])
-        img_resources[row['countryFromCode']]=l
-        l=apininja.get_flag(row['countryToCode'])
-        img_resources[row['countryToCode']] = l
-
-    latest_ts = db.session.query(
-        func.max(Search.timestamp)
-    ).scalar()
-    return render_template('index.html',itineraries=result,logos=logos, latest_ts=latest_ts,img_resources=img_resources)
+    with timer("page_cache"):
+        key, modified = page_version()
+        cache = PageCache(current_app.config['PAGE_CACHE_DIR'])
+        body = cache.get(LONGWEEKEND_PAGE, key)
+    if body is None:
+        body = render_longweekend()
+        with timer("page_cache"):
+            cache.put(LONGWEEKEND_PAGE, key, body)
+    response = make_response(body)
+    response.add_etag()
+    if modified is not None:
+        response.last_modified = modified
+    # browsers revalidate every time, an unchanged page costs a 304 without body
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@main.route('/metrics')
+def metrics():
+    """Phase counters of this worker and the last run of each CLI command, in the Prometheus text format."""
+    body = prometheus_text("web", current_app.config['METRICS_DIR'])
+    return current_app.response_class(body, mimetype="text/plain; version=0.0.4")
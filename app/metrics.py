@@ -0,0 +1,150 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging import Logger
+from typing import Iterable, Iterator, Optional, TypeVar
+
+from sqlalchemy import event
+
+METRIC_PREFIX = "longweekend"
+# phase of the statements run outside every timer
+NO_PHASE = "other"
+PHASE_FIELDS = ("calls", "seconds", "statements", "sql_seconds")
+SNAPSHOT_SUFFIX = ".json"
+
+current_phase: ContextVar[str] = ContextVar("current_phase", default=NO_PHASE)
+
+T = TypeVar("T")
+
+
+class Metrics:
+    """
+    Per-phase counters of this process: calls, seconds, SQL statements and the seconds SQLite spent on them.
+
+    seconds of a phase include the phases nested in it, statements belong to the innermost phase only.
+    Phases run on several threads (the Kiwi downloads of a scan), so their seconds may add up to more
+    than the wall clock time.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def add(self, phase: str, **values: float) -> None:
+        with self.lock:
+            counters = self.phases.setdefault(phase, dict.fromkeys(PHASE_FIELDS, 0))
+            for name, value in values.items():
+                counters[name] += value
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            return {phase: dict(counters) for phase, counters in self.phases.items()}
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def timer(phase: str) -> Iterator[None]:
+    """Times the block as phase, the statements it executes are counted for phase too."""
+    token = current_phase.set(phase)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(phase, calls=1, seconds=time.perf_counter() - started)
+        current_phase.reset(token)
+
+
+def timed_iter(phase: str, items: Iterable[T]) -> Iterator[T]:
+    """Yields items, timing the production of each one as a call of phase."""
+    iterator = iter(items)
+    while True:
+        with timer(phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def instrument_engine(engine) -> None:
+    """Counts the statements of engine and their execution time for the phase they run in."""
+
+    # the start time lives on the execution context, a failed statement leaves nothing behind on the connection
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(connection, cursor, statement, parameters, context, executemany):
+        context._statement_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(connection, cursor, statement, parameters, context, executemany):
+        metrics.add(current_phase.get(), statements=1,
+                    sql_seconds=time.perf_counter() - context._statement_started)
+
+
+def log_metrics(logger: Logger, source: str) -> None:
+    """Logs one logfmt line per phase, so the lines can be grepped and parsed from log.log."""
+    for phase, counters in sorted(metrics.snapshot().items()):
+        logger.info(f"metrics source={source} phase={phase} calls={counters['calls']} "
+                    f"seconds={counters['seconds']:.3f} statements={counters['statements']} "
+                    f"sql_seconds={counters['sql_seconds']:.3f}")
+
+
+def save_metrics(directory: str, source: str) -> None:
+    """Stores the counters of a finished CLI command, the web workers expose the last one of each source."""
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{source}.", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as fo:
+        json.dump(dict(source=source, finished=datetime.now().timestamp(), phases=metrics.snapshot()), fo)
+    os.replace(temp_path, os.path.join(directory, source + SNAPSHOT_SUFFIX))
+
+
+def saved_metrics(directory: str) -> list[dict]:
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for file in sorted(os.listdir(directory)):
+        if file.endswith(SNAPSHOT_SUFFIX):
+            try:
+                with open(os.path.join(directory, file), encoding="utf-8") as fo:
+                    snapshots.append(json.load(fo))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def metric_lines(name: str, kind: str, help_text: str, samples: list[tuple[dict[str, str], float]]) -> list[str]:
+    lines = [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} {kind}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+        lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+    return lines
+
+
+def prometheus_text(source: str, directory: Optional[str] = None) -> str:
+    """
+    Renders the counters of this process as source, and the last saved run of every CLI command,
+    in the Prometheus text format.
+    """
+    current = metrics.snapshot()
+    lines = []
+    for field, help_text in (("calls", "Times a phase ran"), ("seconds", "Seconds spent in a phase"),
+                             ("statements", "SQL statements executed in a phase"),
+                             ("sql_seconds", "Seconds SQLite spent on the statements of a phase")):
+        lines += metric_lines(f"phase_{field}_total", "counter", f"{help_text} since the process started",
+                              [(dict(source=source, phase=phase), counters[field])
+                               for phase, counters in sorted(current.items())])
+    snapshots = saved_metrics(directory) if directory else []
+    if snapshots:
+        lines += metric_lines("last_run_finished_seconds", "gauge", "Unix time the last run of a command finished",
+                              [(dict(source=snapshot["source"]), snapshot["finished"]) for snapshot in snapshots])
+        for field in PHASE_FIELDS:
+            lines += metric_lines(f"last_run_phase_{field}", "gauge", f"Phase {field} of the last run of a command",
+                                  [(dict(source=snapshot["source"], phase=phase), counters[field])
+                                   for snapshot in snapshots for phase, counters in sorted(snapshot["phases"].items())])
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Index,text,Computed
+from sqlalchemy import Index,text
 
 from . import db
 
@@ -8,7 +8,13 @@ class Itinerary(db.Model):
     __table_args__ = (
         db.UniqueConstraint('search_id', 'itinerary_id'),
         db.Index('ix_itinerary_search_itinerary_id', 'search_id', 'itinerary_id'),
-        db.Index("idx_itinerary_month_flyto_price","month", "flyTo", "price")
+        # covers the first window of the monthly ranking, see sql/monthly_5_cheapest.sql
+        db.Index("ix_itinerary_ranking", "month", "flyTo", "price", "search_id"),
+        # unchanged itineraries of the actual searches are found by it and carried forward by incremental scans
+        db.Index("ix_itinerary_fingerprint", "fingerprint"),
+        # the (price, rowid) order of the itinerary API filtered by month or destination, see app/main/api.py
+        db.Index("ix_itinerary_month_price", "month", "price"),
+        db.Index("ix_itinerary_destination_price", "flyTo", "price")
     )
 
     rowid = db.Column(db.Integer, primary_key=True)
@@ -16,14 +22,6 @@ class Itinerary(db.Model):
     itinerary_id = db.Column(db.String(255), nullable=False, index=True)
     flyFrom = db.Column(db.String(3), nullable=False)
     flyTo = db.Column(db.String(3), nullable=False)
-    cityFrom = db.Column(db.String(50), nullable=False)
-    cityCodeFrom = db.Column(db.String(3), nullable=False)
-    cityTo = db.Column(db.String(50), nullable=False)
-    cityCodeTo = db.Column(db.String(3), nullable=False)
-    countryFromCode = db.Column(db.String(2), nullable=False)
-    countryFromName = db.Column(db.String(50), nullable=False)
-    countryToCode = db.Column(db.String(2), nullable=False)
-    countryToName = db.Column(db.String(50), nullable=False)
     local_departure = db.Column(db.DateTime, nullable=False)
     local_arrival = db.Column(db.DateTime, nullable=False)
     nightsInDest = db.Column(db.Integer, nullable=False)
@@ -35,8 +33,6 @@ class Itinerary(db.Model):
     conversionEUR = db.Column(db.Float, nullable=False)
     availabilitySeats = db.Column(db.Integer)
     airlines = db.Column(db.String(30), nullable=False)
-    booking_token = db.Column(db.String(2048), nullable=False)
-    deep_link = db.Column(db.String(2048), nullable=False)
     facilitated_booking_available = db.Column(db.Boolean, nullable=False)
     pnr_count = db.Column(db.Integer, nullable=False)
     has_airport_change = db.Column(db.Boolean, nullable=False)
@@ -46,10 +42,80 @@ class Itinerary(db.Model):
     virtual_interlining = db.Column(db.Boolean, nullable=False)
     rlocal_departure = db.Column(db.DateTime)
     rlocal_arrival = db.Column(db.DateTime)
-    month = db.Column(db.Text(11),Computed("strftime('%Y-%m', local_departure)", persisted=True),nullable=False)
+    # strftime('%Y-%m', local_departure), written by the importers: a computed column cannot be read from an index
+    month = db.Column(db.Text(11),nullable=False)
+    # app.history.offer_fingerprint, NULL for itineraries imported before it existed
+    fingerprint = db.Column(db.BigInteger)
 
     search = db.relationship('Search', back_populates='itineraries')
     routes = db.relationship('Route', secondary='itinerary2route', back_populates='itineraries')
+    booking = db.relationship('Booking', back_populates='itinerary', uselist=False, cascade="all, delete-orphan")
+
+
+class Place(db.Model):
+    """
+    An airport itineraries fly from or to, joined on Itinerary.flyFrom and flyTo. Its city and country
+    are stored once per IATA code instead of in every itinerary row.
+    """
+    __tablename__ = 'place'
+
+    code = db.Column(db.String(3), primary_key=True)
+    city = db.Column(db.String(50), nullable=False)
+    cityCode = db.Column(db.String(3), nullable=False)
+    countryCode = db.Column(db.String(2), nullable=False)
+    countryName = db.Column(db.String(50), nullable=False)
+
+
+class Booking(db.Model):
+    """
+    The booking token and deep link of an itinerary. They are only needed for the displayed rows,
+    so they are kept out of the itinerary table the ranking scans.
+    """
+    __tablename__ = 'booking'
+
+    itinerary_id = db.Column(db.Integer, db.ForeignKey('itinerary.rowid'), primary_key=True)
+    booking_token = db.Column(db.String(2048), nullable=False)
+    deep_link = db.Column(db.String(2048), nullable=False)
+
+    itinerary = db.relationship('Itinerary', back_populates='booking')
+
+
+
+class PriceTrack(db.Model):
+    """
+    An itinerary followed across scans, identified by the fingerprint of its flights (see app.history).
+    Written when the flights are first seen, its price changes are the PriceChange rows.
+    """
+    __tablename__ = 'price_track'
+    __table_args__ = (
+        db.Index("ix_price_track_destination", "flyTo", "month"),
+        # the tracks a search window covers, for the itineraries it no longer offers
+        db.Index("ix_price_track_departure", "flyFrom", "local_departure"),
+        {"sqlite_with_rowid": False},
+    )
+
+    fingerprint = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    flyFrom = db.Column(db.String(3), nullable=False)
+    flyTo = db.Column(db.String(3), nullable=False)
+    month = db.Column(db.Text(11), nullable=False)
+    local_departure = db.Column(db.DateTime, nullable=False)
+    rlocal_departure = db.Column(db.DateTime)
+    nightsInDest = db.Column(db.Integer, nullable=False)
+    airlines = db.Column(db.String(30), nullable=False)
+
+
+class PriceChange(db.Model):
+    """
+    The price history of a tracked itinerary, delta encoded: a row is only written when a scan sees a price
+    or seat count different from the previous row. price NULL means the itinerary was no longer offered.
+    """
+    __tablename__ = 'price_history'
+    __table_args__ = ({"sqlite_with_rowid": False},)
+
+    fingerprint = db.Column(db.BigInteger, db.ForeignKey('price_track.fingerprint'), primary_key=True)
+    observed = db.Column(db.DateTime, primary_key=True)
+    price = db.Column(db.Float)
+    seats = db.Column(db.Integer)
 
 
 
@@ -93,15 +159,15 @@ class Route(db.Model):
     itineraries = db.relationship('Itinerary', secondary='itinerary2route', back_populates='routes')
 
     def compare(self, new_route: 'Route') -> dict[str, tuple[str, str]]:
-        """ Compares the attributes of the current instance with those of a new instance."""
+        """ Compares the mapped columns of the current instance with those of a new instance."""
         return {
-            item: (
-                str(self.__getattribute__(item)),
-                str(new_route.__getattribute__(item)),
+            column.key: (
+                str(getattr(self, column.key)),
+                str(getattr(new_route, column.key)),
             )
-            for item in self.__dict__
-            if item not in ("_sa_instance_state", "rowid", "itineraries")
-               and self.__getattribute__(item) != new_route.__getattribute__(item)
+            for column in self.__table__.columns
+            if column.key != "rowid"
+               and getattr(self, column.key) != getattr(new_route, column.key)
         }
 
 
@@ -118,5 +184,114 @@ class Search(db.Model):
     actual = db.Column(db.Boolean, nullable=False, index=True)
     currency = db.Column(db.String(3), nullable=False, default="HUF", server_default=text("'HUF'"))
     fx_rate = db.Column(db.Float, nullable=False, default=385.533292, server_default="385.533292")
+    generation_id = db.Column(db.Integer, db.ForeignKey('generation.rowid'), index=True)
 
     itineraries = db.relationship('Itinerary', back_populates='search')
+    generation = db.relationship('Generation', back_populates='searches')
+
+
+class Generation(db.Model):
+    """
+    One scan run. Its searches are written with actual=False and become the actual ones together,
+    when the scan finishes and the generation is activated.
+    """
+    __tablename__ = 'generation'
+
+    rowid = db.Column(db.Integer, primary_key=True)
+    started = db.Column(db.DateTime, nullable=False)
+    finished = db.Column(db.DateTime)
+    active = db.Column(db.Boolean, nullable=False, default=False, server_default=text("0"), index=True)
+
+    searches = db.relationship('Search', back_populates='generation')
+    jobs = db.relationship('ScanJob', back_populates='generation')
+
+
+class ScanOrigin(db.Model):
+    """
+    A departure airport the scheduler searches from, with the nights at the destination and the number of
+    monthly windows ahead (from the current month) of its searches. See flask set_origin.
+    """
+    __tablename__ = 'scan_origin'
+
+    code = db.Column(db.String(3), primary_key=True)
+    nights_from = db.Column(db.Integer, nullable=False, default=2, server_default="2")
+    nights_to = db.Column(db.Integer, nullable=False, default=3, server_default="3")
+    months = db.Column(db.Integer, nullable=False, default=13, server_default="13")
+    enabled = db.Column(db.Boolean, nullable=False, default=True, server_default=text("1"))
+
+
+class ScanJob(db.Model):
+    """
+    One Kiwi search of a scan generation, an origin and a monthly window, in the persistent queue
+    flask worker drains (see app.scanqueue). A worker leases the job, downloads the response into the spool,
+    imports it and checkpoints the job as imported in the same transaction. A job whose lease expired is
+    leased again, a failed download is queued again after a backoff until it runs out of attempts.
+    """
+    __tablename__ = 'scan_job'
+    __table_args__ = (
+        db.UniqueConstraint("generation_id", "fly_from", "range_start"),
+        # the jobs a worker can lease
+        db.Index("ix_scan_job_state", "state", "not_before"),
+    )
+
+    QUEUED = "queued"
+    LEASED = "leased"
+    FETCHED = "fetched"
+    IMPORTED = "imported"
+    FAILED = "failed"
+
+    rowid = db.Column(db.Integer, primary_key=True)
+    generation_id = db.Column(db.Integer, db.ForeignKey('generation.rowid'), nullable=False)
+    fly_from = db.Column(db.String(3), nullable=False)
+    range_start = db.Column(db.Date, nullable=False)
+    range_end = db.Column(db.Date, nullable=False)
+    nights_from = db.Column(db.Integer, nullable=False)
+    nights_to = db.Column(db.Integer, nullable=False)
+    state = db.Column(db.String(8), nullable=False, default=QUEUED, server_default=QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # a queued job is not leased before this, the backoff of its retries
+    not_before = db.Column(db.DateTime)
+    lease_owner = db.Column(db.String(64))
+    lease_expires = db.Column(db.DateTime)
+    url = db.Column(db.String(2048))
+    error = db.Column(db.String(1024))
+    # the search the job was imported into, with the rowids of the itineraries it carried forward (JSON list)
+    search_rowid = db.Column(db.Integer)
+    carried = db.Column(db.Text)
+    updated = db.Column(db.DateTime, nullable=False)
+
+    generation = db.relationship('Generation', back_populates='jobs')
+
+
+class MonthlyTop(db.Model):
+    """
+    The 5 cheapest destinations of every month, computed from the actual searches by
+    sql/monthly_5_cheapest.sql. Rebuilt when a generation is activated, the page only reads it.
+    """
+    __tablename__ = 'monthly_top'
+    __table_args__ = (
+        # the page reads the rows in this order, see longweekend_rows
+        db.Index("ix_monthly_top_month_price", "month", "price"),
+    )
+
+    rowid = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Text(11), nullable=False)
+    flyFrom = db.Column(db.String(3), nullable=False)
+    flyTo = db.Column(db.String(3), nullable=False)
+    cityFrom = db.Column(db.String(50), nullable=False)
+    cityTo = db.Column(db.String(50), nullable=False)
+    countryFromCode = db.Column(db.String(2), nullable=False)
+    countryToCode = db.Column(db.String(2), nullable=False)
+    local_departure = db.Column(db.DateTime, nullable=False)
+    local_arrival = db.Column(db.DateTime, nullable=False)
+    rlocal_departure = db.Column(db.DateTime)
+    rlocal_arrival = db.Column(db.DateTime)
+    price = db.Column(db.Float, nullable=False)
+    durationDeparture = db.Column(db.Integer, nullable=False)
+    durationReturn = db.Column(db.Integer, nullable=False)
+    nightsInDest = db.Column(db.Integer, nullable=False)
+    deep_link = db.Column(db.String(2048), nullable=False)
+    firstairline = db.Column(db.String(30), nullable=False)
+    currency = db.Column(db.String(3), nullable=False)
+    fx_rate = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,53 @@
+import re
+from typing import NamedTuple
+
+from sqlalchemy import Connection
+
+PLAN_STEP = re.compile(r"(SCAN|SEARCH) (\S+)(?: USING (.*))?")
+
+# aliases of the base tables in sql/monthly_5_cheapest.sql, and the ones the ranking must read from an index only
+RANKING_TABLES = {"i": "itinerary", "s": "search", "b": "booking", "place_from": "place", "place_to": "place"}
+RANKING_COVERED = {"i"}
+
+
+class PlanStep(NamedTuple):
+    id: int
+    parent: int
+    detail: str
+
+
+def query_plan(connection: Connection, sql: str, parameters=()) -> list[PlanStep]:
+    """Returns the plan of a query, parameters are the DB-API parameters of its placeholders."""
+    return [PlanStep(row[0], row[1], row[3])
+            for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql.strip().rstrip(";"), parameters)]
+
+
+def plan_problems(plan: list[PlanStep], tables: dict[str, str], covered: set[str]) -> list[str]:
+    """
+    Returns the regressions of a query plan:
+    - a base table scanned without an index,
+    - a table of covered read through an index that does not cover the query,
+    - a temporary B-tree sorting the rows a loop over a base table produces, sorts of small intermediate results are fine.
+    tables maps the aliases the query uses to the table names. Row lookups by rowid of the few displayed rows are fine.
+    """
+    problems = []
+    looping = {}
+    for step in plan:
+        match = PLAN_STEP.match(step.detail)
+        if match is None or match[2] not in tables:
+            continue
+        operation, alias, index = match[1], match[2], match[3] or ""
+        table = tables[alias]
+        by_rowid = "INTEGER PRIMARY KEY" in index
+        if operation == "SCAN":
+            looping[step.parent] = table
+            if "INDEX" not in index:
+                problems.append(f"full table scan of {table}: {step.detail}")
+        elif alias in covered and not by_rowid:
+            looping[step.parent] = table
+        if alias in covered and not by_rowid and "COVERING INDEX" not in index and "INDEX" in index:
+            problems.append(f"{table} is read from the table, not from a covering index: {step.detail}")
+    for step in plan:
+        if step.detail.startswith("USE TEMP B-TREE") and step.parent in looping:
+            problems.append(f"temporary B-tree over the rows of {looping[step.parent]}: {step.detail}")
+    return problems
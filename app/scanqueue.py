@@ -0,0 +1,191 @@
+import json
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, update, func, or_, and_, exists
+
+from .models import ScanJob, ScanOrigin, Generation
+
+# a failed download is queued again after min(attempts * RETRY_BACKOFF, MAX_BACKOFF)
+RETRY_BACKOFF = timedelta(seconds=5)
+MAX_BACKOFF = timedelta(seconds=30)
+# the jobs a generation still waits for
+OPEN_STATES = (ScanJob.QUEUED, ScanJob.LEASED, ScanJob.FETCHED)
+LEASED_STATES = (ScanJob.LEASED, ScanJob.FETCHED)
+
+
+class LeaseLost(Exception):
+    """The lease of a job expired and another worker took it over, the work done under it must be dropped."""
+
+
+def month_ranges(range_start:date, months:int=13)->list[tuple[date,date]]:
+    ranges=[]
+    for _ in range(months):
+        range_end = range_start + relativedelta(months=1, day=1, days=-1)
+        ranges.append((range_start, range_end))
+        range_start = range_start + relativedelta(months=1, day=1)
+    return ranges
+
+
+class ScanQueue:
+    """
+    The persistent queue of the Kiwi searches of the scans, the scan_job table. The scheduler expands the
+    enabled origins into the jobs of a generation, workers lease them in batches, download and import them.
+
+    Leases are taken with a conditional UPDATE ... RETURNING, so workers in several processes never get the
+    same job. A lease is renewed while its worker is alive; when it expires, the job is leased again by
+    any worker. A job only moves on under the lease of the worker holding it, so the late result of an expired
+    lease is dropped and every job is imported once. Every method that changes a job commits, except imported,
+    which joins the import transaction.
+
+    Usage:
+        db_utils.start_generation(ScanQueue.plan(queue.origins(), date.today()))
+        for job in queue.lease("host:pid", 4): ...
+    """
+
+    def __init__(self, session, lease_time:timedelta, max_attempts:int) -> None:
+        self.session = session
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+
+    def origins(self) -> list:
+        origin = ScanOrigin.__table__
+        return self.session.execute(select(origin).where(origin.c.enabled.is_(True)).order_by(origin.c.code)).all()
+
+    @staticmethod
+    def plan(origins:Iterable, range_start:date) -> list[dict]:
+        """
+        Expands the origins into the scan_job values of a generation starting at range_start. The nearest month
+        of every origin comes first, so the workers cover the origins side by side.
+        """
+        created = datetime.now()
+        origins = list(origins)
+        ranges = month_ranges(range_start, max((origin.months for origin in origins), default=0))
+        return [dict(fly_from=origin.code, range_start=start, range_end=end, nights_from=origin.nights_from,
+                     nights_to=origin.nights_to, state=ScanJob.QUEUED, attempts=0, updated=created)
+                for offset, (start, end) in enumerate(ranges) for origin in origins if offset < origin.months]
+
+    @staticmethod
+    def available(now:datetime):
+        job = ScanJob.__table__
+        return or_(and_(job.c.state == ScanJob.QUEUED, or_(job.c.not_before.is_(None), job.c.not_before <= now)),
+                   and_(job.c.state.in_(LEASED_STATES), job.c.lease_expires < now))
+
+    def lease(self, owner:str, limit:int) -> list:
+        """Leases up to limit jobs to owner, the ones of the oldest generation first, and returns them."""
+        if limit <= 0:
+            return []
+        job = ScanJob.__table__
+        now = datetime.now()
+        candidates = self.session.scalars(select(job.c.rowid).where(self.available(now))
+                                          .order_by(job.c.generation_id, job.c.rowid).limit(limit)).all()
+        if not candidates:
+            return []
+        # another worker may have leased some of the candidates since, they no longer match
+        leased = self.session.execute(update(job).where(job.c.rowid.in_(candidates), self.available(now))
+                                      .values(state=ScanJob.LEASED, lease_owner=owner,
+                                              lease_expires=now + self.lease_time, attempts=job.c.attempts + 1,
+                                              updated=now)
+                                      .returning(*job.c)).all()
+        self.session.commit()
+        return sorted(leased, key=lambda row: row.rowid)
+
+    def renew(self, owner:str) -> None:
+        """Extends the leases of the jobs owner is still working on."""
+        job = ScanJob.__table__
+        now = datetime.now()
+        self.session.execute(update(job).where(job.c.lease_owner == owner, job.c.state.in_(LEASED_STATES))
+                             .values(lease_expires=now + self.lease_time))
+        self.session.commit()
+
+    def fetched(self, job, url:str) -> bool:
+        """Checkpoints a leased job as downloaded. Returns False if the lease was lost, the download is stale."""
+        held = self.set_state(job, ScanJob.FETCHED, url=url)
+        self.session.commit()
+        return held
+
+    def imported(self, job, url:str, search_rowid:int=None, carried:list[int]=None) -> None:
+        """
+        Checkpoints a job as imported with the transaction of its search, nothing is committed.
+        Raises LeaseLost if the job is no longer leased to its worker, the caller must roll the import back.
+        """
+        if not self.set_state(job, ScanJob.IMPORTED, url=url, search_rowid=search_rowid,
+                              carried=json.dumps(carried) if carried else None, lease_owner=None, lease_expires=None):
+            raise LeaseLost(f"Job {job.rowid} is no longer leased to {job.lease_owner}")
+
+    def retry(self, job, error:str) -> Optional[str]:
+        """
+        Queues a leased job again after a backoff, or fails it for good once it ran out of attempts.
+        Returns the new state, or None if the lease was lost and the job is left to its new worker.
+        """
+        now = datetime.now()
+        if job.attempts >= self.max_attempts:
+            state = ScanJob.FAILED
+            held = self.set_state(job, state, error=error[:1024], lease_owner=None, lease_expires=None)
+        else:
+            state = ScanJob.QUEUED
+            held = self.set_state(job, state, error=error[:1024], lease_owner=None, lease_expires=None,
+                                  not_before=now + min(job.attempts * RETRY_BACKOFF, MAX_BACKOFF))
+        self.session.commit()
+        return state if held else None
+
+    def reopen(self, generation_id:int) -> None:
+        """
+        Queues the jobs of a died scan again: the ones whose leases expired, and the ones that ran out of attempts,
+        with a new round of them. Jobs a live worker holds keep their lease, it renews them until they are done.
+        """
+        job = ScanJob.__table__
+        now = datetime.now()
+        self.session.execute(update(job).where(job.c.generation_id == generation_id,
+                                               job.c.state.in_(LEASED_STATES), job.c.lease_expires < now)
+                             .values(state=ScanJob.QUEUED, lease_owner=None, lease_expires=None, updated=now))
+        self.session.execute(update(job).where(job.c.generation_id == generation_id, job.c.state == ScanJob.FAILED)
+                             .values(state=ScanJob.QUEUED, attempts=0, not_before=None, updated=now))
+        self.session.commit()
+
+    def set_state(self, leased, state:str, **values) -> bool:
+        """
+        Moves a job on under the lease it was handed out with, leased is the row lease() returned.
+        Returns False if nothing changed: the lease expired and the job was leased again, or it was superseded.
+        """
+        job = ScanJob.__table__
+        result = self.session.execute(update(job).where(job.c.rowid == leased.rowid,
+                                                        job.c.lease_owner == leased.lease_owner,
+                                                        job.c.attempts == leased.attempts,
+                                                        job.c.state.in_(LEASED_STATES))
+                                      .values(state=state, updated=datetime.now(), **values))
+        return result.rowcount == 1
+
+    def waiting(self, owner:str) -> bool:
+        """
+        True while a job is queued, to be leased now or after its backoff, or leased by another worker.
+        The lease of a died worker expires and the job is leased again, so its generation is still completed.
+        """
+        job = ScanJob.__table__
+        return self.session.scalar(select(exists().where(or_(
+            job.c.state == ScanJob.QUEUED,
+            and_(job.c.state.in_(LEASED_STATES), job.c.lease_owner != owner)))))
+
+    def open_jobs(self, generation_id:int) -> int:
+        job = ScanJob.__table__
+        return self.session.scalar(select(func.count()).select_from(job)
+                                   .where(job.c.generation_id == generation_id, job.c.state.in_(OPEN_STATES)))
+
+    def complete_generations(self) -> list[int]:
+        """Returns the unfinished generations whose jobs are all imported or failed, ready to be activated."""
+        job = ScanJob.__table__
+        generation = Generation.__table__
+        return self.session.scalars(
+            select(generation.c.rowid)
+            .where(generation.c.finished.is_(None),
+                   exists().where(job.c.generation_id == generation.c.rowid),
+                   ~exists().where(job.c.generation_id == generation.c.rowid, job.c.state.in_(OPEN_STATES)))
+            .order_by(generation.c.rowid)).all()
+
+    def carried(self, generation_id:int) -> dict[int, list[int]]:
+        """Returns search rowid -> rowids of the itineraries the imported jobs of a generation carried forward."""
+        job = ScanJob.__table__
+        rows = self.session.execute(select(job.c.search_rowid, job.c.carried)
+                                    .where(job.c.generation_id == generation_id, job.c.carried.isnot(None)))
+        return {search_rowid: json.loads(carried) for search_rowid, carried in rows}
@@ -0,0 +1,125 @@
+"""
+Import and page query throughput with SQLite's default settings and with the configured writer and bulk roles.
+
+    python -m benchmarks.sqlite_profiles --searches 26 --itineraries 1000 --dir /var/tmp
+
+Every profile gets a fresh database in --dir, use a directory on the disk the real database lives on,
+fsync costs are the point of the comparison.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import create_app, db, use_sqlite_role, sqlite_pragmas
+from app.commands import make_importer
+from benchmarks.synthetic import search_response
+from config import Config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RANKING_SQL = os.path.join(PROJECT_ROOT, "sql", "monthly_5_cheapest.sql")
+
+# connection role of the import and config overrides of each profile,
+# "sqlite defaults" is what a connection gets without any pragma
+PROFILES = {
+    "sqlite defaults": ("writer", dict(SQLITE_JOURNAL_MODE="DELETE", SQLITE_SYNCHRONOUS="FULL",
+                                       SQLITE_CACHE_SIZE=-2000, SQLITE_MMAP_SIZE=0, SQLITE_TEMP_STORE="DEFAULT",
+                                       SQLITE_BUSY_TIMEOUT=0)),
+    "writer": ("writer", {}),
+    "bulk": ("bulk", {}),
+}
+
+class PageReader(threading.Thread):
+    """Reads monthly_top like a web worker while the import runs, counting the reads the writer blocked."""
+
+    def __init__(self, path: str, config) -> None:
+        super().__init__(daemon=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=0)
+        for name, value in sqlite_pragmas(config, "reader"):
+            self.connection.execute(f"PRAGMA {name}={value}")
+        self.stopped = threading.Event()
+        self.reads = 0
+        self.failed = 0
+        self.slowest = 0.0
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            try:
+                self.connection.execute("SELECT * FROM monthly_top ORDER BY month, price").fetchall()
+                self.reads += 1
+            except sqlite3.OperationalError:
+                self.failed += 1
+            self.slowest = max(self.slowest, time.perf_counter() - started)
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+        self.connection.close()
+
+
+def run_profile(name: str, role: str, overrides: dict, directory: str, searches: int, itineraries: int,
+                queries: int) -> dict:
+    path = os.path.join(directory, f"bench-{name.replace(' ', '-')}.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    # the engine is created by create_app, the pragmas are read from app.config on every new connection
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{path}"
+    app = create_app()
+    app.config.update(overrides)
+    with app.app_context():
+        db.create_all()
+        use_sqlite_role(role)
+        importer = make_importer(False)
+        range_start = datetime(2026, 11, 1)
+        reader = PageReader(path, app.config)
+        reader.start()
+        started = time.perf_counter()
+        for seed in range(searches):
+            month = range_start + timedelta(days=31 * (seed % 13))
+            importer.insert_json(search_response(itineraries, seed, month), url="bench", timestamp=datetime.now(),
+                                 range_start=month.date(), range_end=(month + timedelta(days=27)).date(), actual=True)
+        write_seconds = time.perf_counter() - started
+        reader.stop()
+
+        use_sqlite_role("reader")
+        with open(RANKING_SQL) as f:
+            ranking = text(f.read())
+        started = time.perf_counter()
+        for _ in range(queries):
+            db.session.execute(ranking).all()
+        read_seconds = time.perf_counter() - started
+        db.session.remove()
+        db.engine.dispose()
+    return dict(profile=name, itineraries_per_second=searches * itineraries / write_seconds,
+                write_seconds=write_seconds, ranking_ms=read_seconds / queries * 1000,
+                blocked_reads=reader.failed, reads=reader.reads + reader.failed, slowest_read_ms=reader.slowest * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--searches", type=int, default=26, help="searches imported, one commit each")
+    parser.add_argument("--itineraries", type=int, default=1000, help="itineraries per search")
+    parser.add_argument("--queries", type=int, default=5, help="runs of the monthly ranking query")
+    parser.add_argument("--dir", default=None, help="directory of the benchmark databases")
+    args = parser.parse_args()
+    directory = args.dir or tempfile.mkdtemp(prefix="longweekend-bench-")
+    os.makedirs(directory, exist_ok=True)
+    print(f"{'profile':<18}{'itineraries/s':>15}{'import s':>10}{'ranking ms':>12}{'blocked reads':>15}"
+          f"{'slowest read ms':>17}")
+    for name, (role, overrides) in PROFILES.items():
+        result = run_profile(name, role, overrides, directory, args.searches, args.itineraries, args.queries)
+        print(f"{result['profile']:<18}{result['itineraries_per_second']:>15.0f}{result['write_seconds']:>10.2f}"
+              f"{result['ranking_ms']:>12.1f}{result['blocked_reads']:>9}/{result['reads']:<5}"
+              f"{result['slowest_read_ms']:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
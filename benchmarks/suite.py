@@ -0,0 +1,242 @@
+"""
+End-to-end timings of the hot paths on synthetic Kiwi responses and a fresh SQLite database.
+
+    python -m benchmarks.suite --searches 13 --itineraries 1000 --legs 4 --overlap 0.8
+    python -m benchmarks.suite --compare benchmarks/results/20261017-120000.json
+
+Every phase reports rows/s, the statements it sent to SQLite and the peak RSS of the process so far.
+The results are saved as JSON (--output), --compare prints the rows/s of a saved run next to this one.
+API Ninjas is never called, its answers are stubbed.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from unittest import mock
+
+from sqlalchemy import event, select, text
+
+from app import create_app, db
+from app.commands import make_importer, DbUtils, MONTHLY_TOP_SQL
+from app.main import views
+from app.main.views import longweekend_codes, longweekend_rows, LONGWEEKEND_PAGE
+from app.models import Search
+from benchmarks.synthetic import search_response
+from common.assets import AIRLINE_FILE, FLAG_FILE, LOGO_PLACEHOLDER, FLAG_PLACEHOLDER
+from common.apininja import Ninja
+from common.pagecache import PageCache
+from config import Config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "results")
+RANGE_START = datetime(2026, 11, 1)
+
+
+class StatementCounter:
+    """Counts the statements an engine sends to the database, executemany counts once."""
+
+    def __init__(self, engine) -> None:
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, connection, cursor, statement, parameters, context, executemany) -> None:
+        self.count += 1
+
+
+class NinjaResponse:
+    """What requests.get returns for the API Ninjas endpoints."""
+    status_code = 200
+    text = ""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def json(self):
+        if "countryflag" in self.url:
+            return {"rectangle_image_url": f"https://flags.invalid/{self.url[-2:]}.png"}
+        return [{"logo_url": f"https://logos.invalid/{self.url[-2:]}.png"}]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and of its finished children, ru_maxrss is KiB on Linux."""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024
+
+
+def timed(phase: str, counter: StatementCounter, work: Callable[[], int], unit: str = "rows") -> dict:
+    """Runs work, which returns the number of rows (or requests, queries) it handled, and measures it."""
+    statements = counter.count
+    started = time.perf_counter()
+    rows = work()
+    seconds = time.perf_counter() - started
+    result = dict(phase=phase, rows=rows, unit=unit, seconds=seconds, rows_per_second=rows / seconds if seconds else 0.0,
+                  statements=counter.count - statements, peak_rss_mb=peak_rss_mb())
+    print(f"{phase:<24}{rows:>9} {unit:<9}{seconds:>9.2f}{result['rows_per_second']:>13.0f}"
+          f"{result['statements']:>12}{result['peak_rss_mb']:>10.0f}")
+    return result
+
+
+def month_start(seed: int) -> datetime:
+    return RANGE_START + timedelta(days=31 * (seed % 13))
+
+
+def write_dumps(save_dir: str, first_seed: int, searches: int, args: argparse.Namespace) -> None:
+    """Writes legacy .json dumps the way a scan with SAVE_FORMAT=json names them, one second apart."""
+    os.makedirs(save_dir, exist_ok=True)
+    timestamp = datetime(2026, 10, 1)
+    for seed in range(first_seed, first_seed + searches):
+        response = search_response(args.itineraries, seed, month_start(seed), args.route_pool, args.legs, args.overlap)
+        name = f"{timestamp + timedelta(seconds=seed):%Y%m%d%H%M%S}-{month_start(seed):%Y%m}.json"
+        with open(os.path.join(save_dir, name), "w", encoding="utf-8") as fo:
+            json.dump(response, fo)
+
+
+def run_suite(args: argparse.Namespace, directory: str) -> list[dict]:
+    # the engine is created by create_app, the paths are read from Config
+    Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, 'bench.sqlite')}"
+    Config.SAVEDIR = os.path.join(directory, "dumps")
+    Config.PAGE_CACHE_DIR = os.path.join(directory, "page_cache")
+    Config.ASSET_STORE = os.path.join(directory, "assets.sqlite")
+    Config.METRICS_DIR = os.path.join(directory, "metrics")
+    views.asset_resolver.store_file = Config.ASSET_STORE
+    app = create_app()
+    results = []
+    with app.app_context(), mock.patch("common.apininja.requests.get", lambda url, **kwargs: NinjaResponse(url)):
+        db.create_all()
+        counter = StatementCounter(db.engine)
+        db_utils = DbUtils(db, app.logger)
+        print(f"{'phase':<24}{'rows':>19}{'seconds':>9}{'rows/s':>13}{'statements':>12}{'RSS MB':>10}")
+
+        # the actual searches of the page, generated before the clock starts
+        responses = [search_response(args.itineraries, seed, month_start(seed), args.route_pool, args.legs,
+                                     args.overlap) for seed in range(args.searches)]
+
+        def insert_json() -> int:
+            importer = make_importer(args.orm)
+            for seed, response in enumerate(responses):
+                start = month_start(seed)
+                importer.insert_json(response, url="bench", timestamp=datetime.now(), range_start=start.date(),
+                                     range_end=(start + timedelta(days=27)).date(), actual=True)
+            return args.searches * args.itineraries
+        results.append(timed("insert_json", counter, insert_json))
+        del responses
+
+        # not actual searches of earlier scans, imported from dumps and purged below
+        write_dumps(Config.SAVEDIR, args.searches, args.searches, args)
+
+        def import_jsons() -> int:
+            options = ["--orm"] if args.orm else ["--workers", str(args.workers)]
+            outcome = app.test_cli_runner().invoke(args=["import_jsons"] + options)
+            if outcome.exception is not None:
+                raise outcome.exception
+            return args.searches * args.itineraries
+        results.append(timed("import_jsons", counter, import_jsons))
+
+        with open(os.path.join(PROJECT_ROOT, MONTHLY_TOP_SQL)) as f:
+            ranking = text(f.read())
+
+        def monthly_5_cheapest() -> int:
+            for _ in range(args.queries):
+                db.session.execute(ranking).all()
+            return args.queries
+        results.append(timed("monthly_5_cheapest.sql", counter, monthly_5_cheapest, "queries"))
+
+        os.chdir(PROJECT_ROOT)
+        db_utils.rebuild_monthly_top()
+        db.session.commit()
+        # what a scan leaves behind: API Ninjas answered, the images are not mirrored yet
+        airlines, countries = longweekend_codes(longweekend_rows())
+        views.asset_resolver.fetch_missing(airlines, countries, app.logger)
+        with Ninja(Config.APININJASKEY, Config.ASSET_STORE) as ninja:
+            ninja.store.set_many(AIRLINE_FILE, dict.fromkeys(airlines, LOGO_PLACEHOLDER))
+            ninja.store.set_many(FLAG_FILE, dict.fromkeys(countries, FLAG_PLACEHOLDER))
+        client = app.test_client()
+        page_cache = PageCache(Config.PAGE_CACHE_DIR)
+
+        def longweekend(cached: bool) -> Callable[[], int]:
+            def requests() -> int:
+                for _ in range(args.requests):
+                    if not cached:
+                        page_cache.invalidate(LONGWEEKEND_PAGE)
+                    response = client.get("/longweekend")
+                    if response.status_code != 200:
+                        raise RuntimeError(f"/longweekend answered {response.status_code}")
+                return args.requests
+            return requests
+        results.append(timed("/longweekend rendered", counter, longweekend(False), "requests"))
+        results.append(timed("/longweekend cached", counter, longweekend(True), "requests"))
+
+        def delete_search() -> int:
+            searches = db.session.scalars(select(Search).where(Search.actual.is_(False)).limit(args.deletes)).all()
+            return sum(db_utils.delete_search(search)[1] for search in searches)
+        results.append(timed("delete_search", counter, delete_search))
+
+        def cleanup() -> int:
+            return db_utils.delete_notactual_searches()[1]
+        results.append(timed("cleanup", counter, cleanup))
+        db.session.remove()
+        db.engine.dispose()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], path: str) -> None:
+    with open(path, encoding="utf-8") as f:
+        previous = {result["phase"]: result for result in json.load(f)["results"]}
+    print(f"\n{'phase':<24}{'before rows/s':>15}{'after rows/s':>15}{'speedup':>9}")
+    for result in results:
+        before = previous.get(result["phase"])
+        if before is None or not before["rows_per_second"]:
+            continue
+        print(f"{result['phase']:<24}{before['rows_per_second']:>15.0f}{result['rows_per_second']:>15.0f}"
+              f"{result['rows_per_second'] / before['rows_per_second']:>8.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--searches", type=int, default=13, help="actual searches, as many again are imported as dumps")
+    parser.add_argument("--itineraries", type=int, default=1000, help="itineraries per search")
+    parser.add_argument("--legs", type=int, default=2, help="routes per itinerary, half of them outbound")
+    parser.add_argument("--overlap", type=float, default=1.0,
+                        help="share of the routes drawn from the pool common to all searches")
+    parser.add_argument("--route-pool", type=int, default=2000, help="common routes per leg")
+    parser.add_argument("--orm", action="store_true", help="import with the ORM importer")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes of import_jsons")
+    parser.add_argument("--queries", type=int, default=20, help="runs of the monthly ranking query")
+    parser.add_argument("--requests", type=int, default=50, help="requests of each /longweekend phase")
+    parser.add_argument("--deletes", type=int, default=3, help="searches deleted one by one before the cleanup")
+    parser.add_argument("--dir", default=None, help="directory of the benchmark database and dumps")
+    parser.add_argument("--output", default=None, help="result file, benchmarks/results/<time>.json by default")
+    parser.add_argument("--compare", default=None, help="result file of an earlier run")
+    args = parser.parse_args()
+    directory = args.dir or tempfile.mkdtemp(prefix="longweekend-bench-")
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.now()
+    results = run_suite(args, directory)
+    output = args.output or os.path.join(RESULTS_DIR, f"{started:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fo:
+        json.dump(dict(started=started.isoformat(), commit=git_commit(), python=platform.python_version(),
+                       sqlite=sqlite3.sqlite_version, parameters=vars(args), results=results), fo, indent=2)
+    print(f"Saved {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
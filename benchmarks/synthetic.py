@@ -0,0 +1,83 @@
+"""Kiwi shaped search responses with random content, for benchmarks that must not call the API."""
+import random
+import uuid
+from datetime import datetime, timedelta
+from itertools import count
+
+from common.kiwi import KIWI_DATETIME_FORMAT
+
+DESTINATIONS = [("LHR", "London", "GB"), ("CDG", "Paris", "FR"), ("FCO", "Rome", "IT"), ("BCN", "Barcelona", "ES"),
+                ("AMS", "Amsterdam", "NL"), ("TLV", "Tel Aviv", "IL"), ("ATH", "Athens", "GR"), ("LIS", "Lisbon", "PT")]
+HOME = ("BUD", "Budapest", "HU")
+HUBS = [("VIE", "Vienna", "AT"), ("MUC", "Munich", "DE"), ("ZRH", "Zurich", "CH")]
+AIRLINES = ["W6", "FR", "LH", "OS", "KL"]
+# route numbers of the pool are below this, the ones only a single response has are above
+UNIQUE_ROUTES = 10 ** 9
+
+
+def kiwi_time(value: datetime) -> str:
+    return value.strftime(KIWI_DATETIME_FORMAT)
+
+
+def route(number: int, fly_from: tuple[str, str, str], fly_to: tuple[str, str, str], departure: datetime,
+          back: bool, rng: random.Random) -> dict:
+    return {"id": f"{number:026d}", "combination_id": f"{number:024d}",
+            "flyFrom": fly_from[0], "flyTo": fly_to[0], "cityFrom": fly_from[1], "cityCodeFrom": fly_from[0],
+            "cityTo": fly_to[1], "cityCodeTo": fly_to[0],
+            "local_departure": kiwi_time(departure), "local_arrival": kiwi_time(departure + timedelta(hours=2)),
+            "airline": rng.choice(AIRLINES), "flight_no": rng.randint(1, 9999), "operating_carrier": "",
+            "operating_flight_no": "", "fare_basis": "QOWHU", "fare_category": "M", "fare_classes": "Q",
+            "return": int(back), "bags_recheck_required": False, "vi_connection": False, "guarantee": False,
+            "equipment": None, "vehicle_type": "aircraft"}
+
+
+def journey(numbers: list[int], fly_from: tuple[str, str, str], fly_to: tuple[str, str, str], departure: datetime,
+            back: bool, rng: random.Random) -> list[dict]:
+    """Returns the legs of one direction, connecting through hubs when there is more than one number."""
+    stops = [fly_from] + [rng.choice(HUBS) for _ in numbers[1:]] + [fly_to]
+    return [route(number, stops[leg], stops[leg + 1], departure + timedelta(hours=3 * leg), back, rng)
+            for leg, number in enumerate(numbers)]
+
+
+def search_response(itineraries: int = 500, seed: int = 0, range_start: datetime = datetime(2026, 11, 1),
+                    route_pool: int = 2000, legs: int = 2, overlap: float = 1.0) -> dict:
+    """
+    Returns one month of search results with legs routes per itinerary, the first half of them outbound.
+    A route is drawn from a pool of route_pool flights per leg with probability overlap, so consecutive
+    responses share routes the way real scans do, the other routes are unique to this response.
+    """
+    rng = random.Random(seed)
+    legs = max(legs, 2)
+    unique = count(UNIQUE_ROUTES * (seed + 1))
+
+    def route_numbers(first: int, last: int) -> list[int]:
+        return [leg * route_pool + rng.randrange(route_pool) if rng.random() < overlap else next(unique)
+                for leg in range(first, last)]
+
+    data = []
+    for number in range(itineraries):
+        departure = range_start + timedelta(days=rng.randint(0, 27), hours=rng.randint(5, 21))
+        destination = rng.choice(DESTINATIONS)
+        nights = rng.randint(2, 4)
+        return_departure = departure + timedelta(days=nights)
+        outbound_legs = (legs + 1) // 2
+        outbound = journey(route_numbers(0, outbound_legs), HOME, destination, departure, False, rng)
+        inbound = journey(route_numbers(outbound_legs, legs), destination, HOME, return_departure, True, rng)
+        airlines = list(dict.fromkeys(leg["airline"] for leg in outbound + inbound))
+        data.append({
+            "id": f"{seed}-{number}", "flyFrom": "BUD", "flyTo": destination[0], "cityFrom": "Budapest",
+            "cityCodeFrom": "BUD", "cityTo": destination[1], "cityCodeTo": destination[0],
+            "countryFrom": {"code": "HU", "name": "Hungary"},
+            "countryTo": {"code": destination[2], "name": destination[1]},
+            "local_departure": kiwi_time(departure), "local_arrival": outbound[-1]["local_arrival"],
+            "nightsInDest": nights, "quality": rng.random() * 300, "distance": rng.randint(500, 2500) * 1.0,
+            "duration": {"departure": 7200, "return": 7200, "total": 14400},
+            "price": rng.randint(20000, 150000), "conversion": {"EUR": rng.randint(50, 380)},
+            "availability": {"seats": rng.choice([None, 1, 3, 9])}, "airlines": airlines,
+            "booking_token": uuid.UUID(int=rng.getrandbits(128)).hex * 8,
+            "deep_link": "https://www.kiwi.com/deep?token=" + uuid.UUID(int=rng.getrandbits(128)).hex * 4,
+            "facilitated_booking_available": True, "pnr_count": 1, "has_airport_change": False,
+            "technical_stops": 0, "throw_away_ticketing": False, "hidden_city_ticketing": False,
+            "virtual_interlining": False, "route": outbound + inbound})
+    return {"search_id": str(uuid.UUID(int=rng.getrandbits(128))), "currency": "HUF", "fx_rate": 385.5,
+            "_results": itineraries, "data": data}
@@ -1,13 +1,33 @@
-import shelve
-
 import requests
-from flask import url_for
+
+from common.assetstore import AssetStore
+
+AIRLINE = "airline"
+FLAG = "flag"
+LOGO_TYPES = ["logo_url","brandmark_url","tail_logo_url"]
 
 
 class Ninja:
-    def __init__(self, api_key,shelve_file:str="shelve"):
+    def __init__(self, api_key,store_file:str="assets.sqlite",readonly:bool=False):
         self.api_key = api_key
-        self.shelve=shelve.open(shelve_file)
+        self.store=AssetStore(store_file,readonly=readonly)
+
+    def close(self)->None:
+        self.store.close()
+
+    def __enter__(self)->"Ninja":
+        return self
+
+    def __exit__(self, *exc)->None:
+        self.close()
+
+    def cached_airline_logos(self, airline_code:str)-> dict[str, str] | None:
+        """Returns the stored logo URLs of an airline, None if it is unknown or was never fetched."""
+        return self.store.get(AIRLINE, airline_code)
+
+    def cached_flag(self, country_code:str)-> str | None:
+        """Returns the stored flag URL of a country, None if it is unknown or was never fetched."""
+        return self.store.get(FLAG, country_code)
 
     def get_airline_logos(self, airline_code:str, cached:bool=True)-> dict[str, str] | None:
         """
@@ -18,42 +38,33 @@ class Ninja:
             airline_code (str): The IATA code of the airline.
 
         Returns:
-            str: The URL of the airline's logo.
+            str: The URL of the airline's logo, None if API Ninjas does not know the airline.
         """
-        logo_types = ["logo_url","brandmark_url","tail_logo_url"]
-
         if cached:
-            logos = {}
-            for logo_type in logo_types:
-                if airline_code+logo_type in self.shelve:
-                    logos[logo_type] = self.shelve[airline_code+logo_type]
-            if len(logos)>0:
-                return logos
+            stored = self.store.get_many(AIRLINE, [airline_code])
+            if airline_code in stored:
+                return stored[airline_code]
 
         response = requests.get(f"https://api.api-ninjas.com/v1/airlines?iata={airline_code}",
                                 headers={'X-Api-Key': self.api_key})
         if response.status_code == 200:
-            data = response.json()[0]
-            logos = {"logo_url":url_for('static', filename="app/static/logos/nologo.png")}
-            for logo_type in logo_types:
-                if logo_type in data:
-                    logo_url = data[logo_type]
-                    self.shelve[airline_code+logo_type]=logo_url
-                    logos[logo_type]=logo_url
-            return logos
+            data = response.json()
+            logos = {logo_type: data[0][logo_type] for logo_type in LOGO_TYPES if data and logo_type in data[0]}
+            self.store.set_many(AIRLINE, {airline_code: logos or None})
+            return logos or None
         else:
             raise Exception(f"Error fetching logo: {response.status_code} - {response.text}")
 
     def get_flag(self,country_code:str,cached:bool=True):
         if cached:
-            if country_code in self.shelve:
-                return self.shelve[country_code]
+            stored = self.store.get_many(FLAG, [country_code])
+            if country_code in stored:
+                return stored[country_code]
         response = requests.get(f"https://api.api-ninjas.com/v1/countryflag?country={country_code}",
                                 headers={'X-Api-Key': self.api_key})
         if response.status_code == 200:
-            data = response.json()
-            flag_url = data["rectangle_image_url"]
-            self.shelve[country_code]=flag_url
+            flag_url = response.json().get("rectangle_image_url")
+            self.store.set_many(FLAG, {country_code: flag_url})
             return flag_url
         else:
             raise Exception(f"Error fetching flag: {response.status_code} - {response.text}")
@@ -0,0 +1,116 @@
+import gzip
+import json
+import mmap
+import os
+import shutil
+import struct
+from typing import BinaryIO, Optional
+
+ARCHIVE_MAGIC = b"LWA1"
+ARCHIVE_SUFFIX = ".lwa"
+MANIFEST_NAME = "import.manifest"
+HEADER_LENGTH = struct.Struct(">I")
+
+
+class DumpArchive:
+    """
+    Compressed archive of one raw Kiwi search response.
+
+    Layout: the ARCHIVE_MAGIC bytes, the length of the index header, the index header as JSON
+    (search_id, range, timestamp, result count, ...) and the gzip compressed response body.
+    The file is memory-mapped, so reading the header does not touch the compressed body.
+
+    Usage:
+        with DumpArchive(path) as archive:
+            if archive.header["search_id"] not in known:
+                stream = ResponseStream(archive.body())
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError(f"{path} is empty")
+        if self.map[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a dump archive")
+        start = len(ARCHIVE_MAGIC) + HEADER_LENGTH.size
+        try:
+            (length,) = HEADER_LENGTH.unpack(self.map[len(ARCHIVE_MAGIC):start])
+            if start + length > len(self.map):
+                raise ValueError(f"header length {length} is beyond the end of the file")
+            self.header = json.loads(self.map[start:start + length])
+        except (struct.error, ValueError) as e:
+            self.close()
+            raise ValueError(f"{path} has a corrupt header: {e}") from e
+        self.body_offset = start + length
+
+    def body(self) -> BinaryIO:
+        """Returns the decompressed response body as a binary file."""
+        self.map.seek(self.body_offset)
+        return gzip.GzipFile(fileobj=self.map, mode="rb")
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> "DumpArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def write(path: str, header: dict, body: BinaryIO, compresslevel: int = 6) -> None:
+        """
+        Writes body, read from its current position, with the given header into a new archive.
+        The archive is written next to path first and renamed, so a crash never leaves half a file.
+        """
+        encoded = json.dumps(header, ensure_ascii=False, default=str).encode("utf-8")
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as fo:
+            fo.write(ARCHIVE_MAGIC)
+            fo.write(HEADER_LENGTH.pack(len(encoded)))
+            fo.write(encoded)
+            with gzip.GzipFile(fileobj=fo, mode="wb", compresslevel=compresslevel, mtime=0) as gz:
+                shutil.copyfileobj(body, gz)
+        os.replace(temp_path, path)
+
+
+class DumpManifest:
+    """
+    Record of the SAVEDIR dump files import_jsons has processed: name -> size, mtime and search_id.
+
+    A file whose size and mtime still match its entry is known without opening it.
+    The manifest lives in SAVEDIR next to the dumps.
+    """
+
+    def __init__(self, save_dir: str) -> None:
+        self.path = os.path.join(save_dir, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as fo:
+                self.entries = json.load(fo)
+
+    def lookup(self, path: str) -> Optional[dict]:
+        """Returns the entry of an unchanged file, None if the file is new or was modified."""
+        entry = self.entries.get(os.path.basename(path))
+        if entry is None:
+            return None
+        stat = os.stat(path)
+        if entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def record(self, path: str, search_id: Optional[str]) -> None:
+        stat = os.stat(path)
+        self.entries[os.path.basename(path)] = dict(size=stat.st_size, mtime=stat.st_mtime_ns, search_id=search_id)
+
+    def save(self) -> None:
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fo:
+            json.dump(self.entries, fo, indent=1)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from logging import Logger
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from common.apininja import Ninja, AIRLINE, FLAG
+
+try:
+    from PIL import Image
+except ImportError:
+    # resizing is optional, without Pillow the images are mirrored as they are
+    Image = None
+
+# store kinds of the mirrored file names, next to the API Ninjas answers
+AIRLINE_FILE = "airline_file"
+FLAG_FILE = "flag_file"
+# files of app/static/logos shown until an asset is mirrored
+LOGO_PLACEHOLDER = "nologo.png"
+FLAG_PLACEHOLDER = "noflag.png"
+# twice the size the page shows them, for dense screens
+LOGO_SIZE = (300, 120)
+FLAG_SIZE = (32, 24)
+DOWNLOAD_TIMEOUT = 30
+
+
+class LRUCache:
+    """Bounded, thread-safe mapping that forgets the least recently used key first."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+
+def shrink_image(content: bytes, size: tuple[int, int]) -> tuple[bytes, Optional[str]]:
+    """
+    Scales an image down to fit size and recompresses it as PNG.
+    Returns the new content and suffix, or the original content and None if it cannot be resized.
+    """
+    if Image is None:
+        return content, None
+    try:
+        with Image.open(BytesIO(content)) as image:
+            image.thumbnail(size)
+            output = BytesIO()
+            image.save(output, format="PNG", optimize=True)
+    except (OSError, ValueError):
+        # svg and other formats Pillow cannot read
+        return content, None
+    return output.getvalue(), ".png"
+
+
+def download_asset(url: str, directory: str, stem: str, size: tuple[int, int]) -> str:
+    """
+    Downloads an image into directory under a content hashed name and returns the file name.
+    The same content always gets the same name, so browsers may cache the files forever.
+    """
+    response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    content, suffix = shrink_image(response.content, size)
+    suffix = suffix or os.path.splitext(urlparse(url).path)[1].lower() or ".png"
+    file_name = f"{stem}-{hashlib.sha1(content).hexdigest()[:16]}{suffix}"
+    path = os.path.join(directory, file_name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{stem}.", suffix=".tmp")
+        with os.fdopen(fd, "wb") as fo:
+            fo.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    return file_name
+
+
+def prune_superseded(directory: str, stem: str, keep: str) -> None:
+    """Deletes the earlier mirrored files of stem, a re-mirrored image gets a new name when its content changed."""
+    prefix = f"{stem}-"
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.name != keep and entry.is_file():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+class AssetResolver:
+    """
+    Local airline logo and country flag files for the pages.
+
+    resolve() never leaves the server: it answers from memory, then from the Ninja store, and serves
+    placeholders for codes without a mirrored file. The CLI fills the store after a scan: fetch_missing()
+    asks API Ninjas for the image URLs and mirror_missing() downloads the images into the mirror directory.
+    hits and misses count the lookups the store answered and the ones it could not.
+
+    Usage:
+        logos, flags = resolver.resolve(airlines, countries)   # code -> file name in the mirror directory
+    """
+
+    def __init__(self, api_key: str, store_file: str = "assets.sqlite", maxsize: int = 1024) -> None:
+        self.api_key = api_key
+        self.store_file = store_file
+        self.logos = LRUCache(maxsize)
+        self.flags = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, airlines: Iterable[str], countries: Iterable[str]) -> tuple[dict[str, str], dict[str, str]]:
+        """Returns airline code -> logo file and country code -> flag file for all the given codes."""
+        logos = {code: self.logos.get(code) for code in set(airlines)}
+        flags = {code: self.flags.get(code) for code in set(countries)}
+        missing_logos = [code for code, file in logos.items() if file is None]
+        missing_flags = [code for code, file in flags.items() if file is None]
+        if missing_logos or missing_flags:
+            # one read-only connection and one query per kind, the scan may be writing meanwhile
+            try:
+                ninja = Ninja(self.api_key, self.store_file, readonly=True)
+            except sqlite3.Error:
+                ninja = None
+            if ninja is not None:
+                with ninja:
+                    for code, file in ninja.store.get_many(AIRLINE_FILE, missing_logos).items():
+                        if file is not None:
+                            logos[code] = file
+                            self.logos.put(code, file)
+                    for code, file in ninja.store.get_many(FLAG_FILE, missing_flags).items():
+                        if file is not None:
+                            flags[code] = file
+                            self.flags.put(code, file)
+                    self.count(ninja)
+        logos = {code: file or LOGO_PLACEHOLDER for code, file in logos.items()}
+        flags = {code: file or FLAG_PLACEHOLDER for code, file in flags.items()}
+        return logos, flags
+
+    def fetch_missing(self, airlines: Iterable[str], countries: Iterable[str], logger: Logger) -> int:
+        """
+        Fetches the logos and flags the store has no fresh record of. A failing code is logged and skipped,
+        its placeholder stays until the next call. Returns the number of codes API Ninjas answered.
+        """
+        airlines, countries = set(airlines), set(countries)
+        fetched = 0
+        with Ninja(self.api_key, self.store_file) as ninja:
+            known_airlines = ninja.store.get_many(AIRLINE, airlines)
+            for code in sorted(airlines - known_airlines.keys()):
+                try:
+                    ninja.get_airline_logos(code, cached=False)
+                    fetched += 1
+                except Exception as e:
+                    logger.warning(f"No logo for {code}: {e}")
+            known_countries = ninja.store.get_many(FLAG, countries)
+            for code in sorted(countries - known_countries.keys()):
+                try:
+                    ninja.get_flag(code, cached=False)
+                    fetched += 1
+                except Exception as e:
+                    logger.warning(f"No flag for {code}: {e}")
+            self.count(ninja)
+        return fetched
+
+    def mirror_missing(self, airlines: Iterable[str], countries: Iterable[str], directory: str,
+                       logger: Logger) -> int:
+        """
+        Downloads the fetched logos and flags without a fresh mirrored file in directory and deletes the files
+        they supersede. A failing download is logged and skipped. Returns the number of downloaded files.
+        """
+        mirrored = 0
+        with Ninja(self.api_key, self.store_file) as ninja:
+            for kind, file_kind, codes, size in ((AIRLINE, AIRLINE_FILE, set(airlines), LOGO_SIZE),
+                                                 (FLAG, FLAG_FILE, set(countries), FLAG_SIZE)):
+                files = ninja.store.get_many(file_kind, codes)
+                pending = [code for code in codes
+                           if not files.get(code) or not os.path.exists(os.path.join(directory, files[code]))]
+                remote = ninja.store.get_many(kind, pending)
+                for code in sorted(pending):
+                    url = remote.get(code)
+                    if isinstance(url, dict):
+                        url = url.get("logo_url")
+                    if not url:
+                        continue
+                    stem = f"{kind}-{code}"
+                    try:
+                        file = download_asset(url, directory, stem, size)
+                    except (requests.RequestException, OSError) as e:
+                        logger.warning(f"Could not mirror {url}: {e}")
+                        continue
+                    ninja.store.set_many(file_kind, {code: file})
+                    prune_superseded(directory, stem, file)
+                    mirrored += 1
+            self.count(ninja)
+        return mirrored
+
+    def count(self, ninja: Ninja) -> None:
+        self.hits += ninja.store.hits
+        self.misses += ninja.store.misses
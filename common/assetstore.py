@@ -0,0 +1,87 @@
+import json
+import sqlite3
+import time
+from datetime import timedelta
+from typing import Iterable, Optional
+
+# how long a fetched asset and a code API Ninjas does not know are trusted
+ASSET_TTL = timedelta(days=30)
+NEGATIVE_TTL = timedelta(days=1)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS asset (
+    kind TEXT NOT NULL,
+    code TEXT NOT NULL,
+    value TEXT,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (kind, code)
+) WITHOUT ROWID
+"""
+
+
+class AssetStore:
+    """
+    SQLite cache of API Ninjas answers, one record per (kind, code).
+
+    value is the JSON encoded answer, NULL records a code API Ninjas does not know, so it is not asked
+    again until NEGATIVE_TTL passes. The database runs in WAL mode: the web workers read while the CLI writes.
+
+    Usage:
+        with AssetStore(path) as store:
+            known = store.get_many("flag", ["HU", "AT"])   # {"HU": "https://...", "AT": None}
+            store.set_many("flag", {"DE": "https://..."})
+    """
+
+    def __init__(self, path: str, readonly: bool = False, ttl: timedelta = ASSET_TTL,
+                 negative_ttl: timedelta = NEGATIVE_TTL) -> None:
+        self.path = path
+        self.ttl = ttl.total_seconds()
+        self.negative_ttl = negative_ttl.total_seconds()
+        self.hits = 0
+        self.misses = 0
+        if readonly:
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+        else:
+            self.connection = sqlite3.connect(path, timeout=30)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(SCHEMA)
+            self.connection.commit()
+
+    def get_many(self, kind: str, codes: Iterable[str]) -> dict[str, Optional[object]]:
+        """
+        Returns the fresh records of the given codes, code -> decoded value or None for a known unknown.
+        Codes without a fresh record are left out.
+        """
+        codes = list(set(codes))
+        if not codes:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(codes))
+        rows = self.connection.execute(
+            f"SELECT code, value FROM asset WHERE kind = ? AND code IN ({placeholders}) "
+            f"AND fetched > ? - CASE WHEN value IS NULL THEN ? ELSE ? END",
+            (kind, *codes, now, self.negative_ttl, self.ttl)).fetchall()
+        found = {code: None if value is None else json.loads(value) for code, value in rows}
+        self.hits += len(found)
+        self.misses += len(codes) - len(found)
+        return found
+
+    def get(self, kind: str, code: str, default: Optional[object] = None) -> Optional[object]:
+        return self.get_many(kind, [code]).get(code, default)
+
+    def set_many(self, kind: str, values: dict[str, Optional[object]]) -> None:
+        """Stores the given records, None marks a code API Ninjas does not know."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO asset (kind, code, value, fetched) VALUES (?, ?, ?, ?)",
+                [(kind, code, None if value is None else json.dumps(value), now) for code, value in values.items()])
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "AssetStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
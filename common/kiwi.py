@@ -1,8 +1,47 @@
+import codecs
+import json
+import threading
+import time
 from datetime import datetime
+from typing import BinaryIO, Iterator, NamedTuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
 
 KIWI_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+KIWI_SEARCH_URL = "https://api.tequila.kiwi.com/v2/search"
+KIWI_RETRY_STATUSES = (429, 500, 502, 503, 504)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class SearchResponse(NamedTuple):
+    status_code: int
+    url: str
+    data: dict
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces out calls so that at most `rate` of them start per second.
+
+    A rate of 0 or less disables limiting.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.interval == 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
 
 class Tequila:
     """
@@ -12,23 +51,58 @@ class Tequila:
 
     Methods:
         - search: Searches for flights based on the provided parameters.
+        - fetch: Same as search, but returns the status and url with the data instead of storing them,
+          so one instance can be shared between threads.
+        - download: Same as fetch, but writes the undecoded JSON body into a file.
+        - close: Releases the pooled connections.
+
+    Every request goes through one keep-alive session with compressed transfers and transport-level
+    retries. The request_count and bytes_transferred counters add up what the client cost so far.
 
     For method details, refer to the individual method docstrings.
     """
 
-    def __init__(self, apikey: str) -> None:
+    def __init__(self, apikey: str, endpoint: str = KIWI_SEARCH_URL, rate_limiter: RateLimiter = None,
+                 pool_size: int = 4, timeout: tuple[float, float] = (10, 120), retries: int = 3,
+                 backoff_factor: float = 1.0) -> None:
         """
         Initializes a Kiwi object with the provided API key.
 
         Args:
             apikey (str): The API key to access the Kiwi API.
+            endpoint (str, optional): The search endpoint. Defaults to the public Tequila API.
+            rate_limiter (RateLimiter, optional): Limiter shared by every request of this client. Defaults to None.
+            pool_size (int, optional): Number of keep-alive connections kept open. Defaults to 4.
+            timeout (tuple, optional): Connect and read timeout of a request in seconds. Defaults to (10, 120).
+            retries (int, optional): Transport-level retries on connection errors and 429/5xx. Defaults to 3.
+            backoff_factor (float, optional): Exponential backoff between retries, a Retry-After header
+                takes precedence. Defaults to 1.0.
 
         Returns:
             None
         """
         self.apikey = apikey
+        self.endpoint = endpoint
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
         self.status_code = 0
         self.search_url = ""
+        self.request_count = 0
+        self.bytes_transferred = 0
+        self.counter_lock = threading.Lock()
+
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=KIWI_RETRY_STATUSES,
+                      allowed_methods=["GET"], respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # gzip and deflate always, br/zstd when the matching decoder is installed
+        self.session.headers.update(make_headers(accept_encoding=True))
+        self.session.headers["apikey"] = apikey
+
+    def close(self) -> None:
+        self.session.close()
 
     def search(self, fly_from: str, date_from: datetime, date_to: datetime, fly_to: str = None,
                nights_in_dst_from: int = None, nights_in_dst_to: int = None, curr: str = "HUF", locale: str = "hu",
@@ -50,14 +124,166 @@ class Tequila:
         Returns:
             dict: A dictionary containing the JSON response from the flight search API.
         """
+        response = self.fetch(fly_from, date_from, date_to, fly_to, nights_in_dst_from, nights_in_dst_to, curr,
+                              locale, **kwargs)
+        self.status_code = response.status_code
+        self.search_url = response.url
+        return response.data
+
+    def fetch(self, fly_from: str, date_from: datetime, date_to: datetime, fly_to: str = None,
+              nights_in_dst_from: int = None, nights_in_dst_to: int = None, curr: str = "HUF", locale: str = "hu",
+              **kwargs) -> SearchResponse:
+        """
+        Searches for flights like search, without touching the state of the instance.
+
+        Returns:
+            SearchResponse: The HTTP status code, the final request url and the decoded JSON response.
+        """
+        params = self.search_params(fly_from, date_from, date_to, fly_to, nights_in_dst_from, nights_in_dst_to,
+                                    curr, locale, **kwargs)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = self.session.get(self.endpoint, params=params, timeout=self.timeout)
+        data = response.json()
+        self.count_response(response)
+        return SearchResponse(response.status_code, response.url, data)
+
+    def download(self, fp: BinaryIO, fly_from: str, date_from: datetime, date_to: datetime,
+                 **kwargs) -> SearchResponse:
+        """
+        Searches for flights like fetch, but streams the raw JSON body into fp instead of decoding it.
+        The body can be read back item by item with ResponseStream.
 
+        Args:
+            fp (BinaryIO): Writable binary file that receives the response body.
+            **kwargs: The search parameters of fetch.
+
+        Returns:
+            SearchResponse: The HTTP status code and the final request url, data is None.
+        """
+        params = self.search_params(fly_from, date_from, date_to, **kwargs)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with self.session.get(self.endpoint, params=params, timeout=self.timeout, stream=True) as response:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                fp.write(chunk)
+            self.count_response(response)
+        fp.flush()
+        return SearchResponse(response.status_code, response.url, None)
+
+    @staticmethod
+    def search_params(fly_from: str, date_from: datetime, date_to: datetime, fly_to: str = None,
+                      nights_in_dst_from: int = None, nights_in_dst_to: int = None, curr: str = "HUF",
+                      locale: str = "hu", **kwargs) -> dict:
         params = {"fly_from": fly_from, "fly_to": fly_to, "date_from": f"{date_from:%d/%m/%Y}",
                    "date_to": f"{date_to:%d/%m/%Y}", "nights_in_dst_from": nights_in_dst_from,
                    "nights_in_dst_to": nights_in_dst_to, "curr": curr, "locale": locale, **kwargs}
-        filtered = {k: v for k, v in params.items() if v is not None}
-        response = requests.get("https://api.tequila.kiwi.com/v2/search", params=filtered,
-                                headers={"apikey": self.apikey})
-        self.status_code = response.status_code
-        self.search_url = response.url
-        return response.json()
+        return {k: v for k, v in params.items() if v is not None}
+
+    def count_response(self, response: requests.Response) -> None:
+        """Adds a read response, including its transport-level retries, to the cost counters."""
+        retries = response.raw.retries
+        attempts = 1 + (len(retries.history) if retries is not None else 0)
+        # tell() is the number of (compressed) bytes read from the wire
+        received = response.raw.tell()
+        with self.counter_lock:
+            self.request_count += attempts
+            self.bytes_transferred += received
+
+
+class ResponseStream:
+    """
+    Incremental reader of a Kiwi search response.
+
+    Iterating the stream yields the elements of the "data" array one by one while only a read buffer
+    and the current itinerary are kept in memory. The other top-level fields (search_id, currency,
+    _results, ...) are collected into header as they are passed, so fields placed after "data" are
+    only available once the iteration finished. The stream can be iterated once; a later iteration
+    continues where the previous one stopped.
+    """
+
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self, fp: BinaryIO, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.header = {}
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.items = self.parse()
+
+    def fill(self) -> None:
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        text = self.text_decoder.decode(chunk, final=self.eof) if isinstance(chunk, bytes) else chunk
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of Kiwi response")
+            self.fill()
+
+    def expect(self, *chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected {' or '.join(chars)} at {self.pos} of the buffer, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # a number cut by the end of the buffer may go on in the next chunk
+            if not self.eof and (end == len(self.buffer) or (isinstance(value, (int, float))
+                                                             and self.buffer[end] in ".eE+-0123456789")):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.items
+
+    def exhaust(self) -> dict:
+        """Reads the rest of the response and returns the complete header."""
+        for _ in self.items:
+            pass
+        return self.header
 
+    def parse(self) -> Iterator[dict]:
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == "data" and self.peek() == "[":
+                self.expect("[")
+                if self.peek() == "]":
+                    self.expect("]")
+                else:
+                    while True:
+                        yield self.value()
+                        if self.expect(",", "]") == "]":
+                            break
+            else:
+                self.header[key] = self.value()
+            if self.expect(",", "}") == "}":
+                return
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from typing import Optional
+
+PAGE_SUFFIX = ".html"
+
+
+class PageCache:
+    """
+    Rendered pages on disk, shared by every process serving the app.
+
+    A page is stored under its name and a version key (the active generation), so a new scan
+    makes the previous rendering unreachable without coordinating the workers.
+    Files are written to a temporary name and renamed, readers never see half a page.
+    Only the writer of the new version drops the old ones: a request that began before the scan
+    was activated may still store the previous version, it must not delete the new one.
+
+    Usage:
+        body = cache.get("longweekend", key)
+        if body is None:
+            body = cache.put("longweekend", key, render())
+        cache.replace("longweekend", key, render())   # after a scan
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, name: str, key: str) -> str:
+        return os.path.join(self.directory, f"{name}.{key}{PAGE_SUFFIX}")
+
+    def get(self, name: str, key: str) -> Optional[str]:
+        try:
+            with open(self.path(name, key), encoding="utf-8") as fo:
+                return fo.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name: str, key: str, body: str) -> str:
+        """Stores body as the rendering of the page version key."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{name}.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fo:
+            fo.write(body)
+        os.replace(temp_path, self.path(name, key))
+        return body
+
+    def replace(self, name: str, key: str, body: str) -> str:
+        """Stores body as the current rendering of the page and drops the other versions of it."""
+        self.put(name, key, body)
+        self.invalidate(name, keep=self.path(name, key))
+        return body
+
+    def invalidate(self, name: str, keep: Optional[str] = None) -> None:
+        """Deletes the stored versions of a page, except keep."""
+        if not os.path.isdir(self.directory):
+            return
+        for file in os.listdir(self.directory):
+            path = os.path.join(self.directory, file)
+            if file.startswith(name + ".") and file.endswith(PAGE_SUFFIX) and path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -9,6 +9,35 @@ class Config:
     SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL','db.sqlite')
     SQLALCHEMY_TRACK_MODIFICATIONS = os.environ.get("SQLALCHEMY_TRACK_MODIFICATIONS",False)
     SQLALCHEMY_ECHO = os.environ.get("SQLALCHEMY_ECHO",False)
+    SQLITE_ROLE = os.environ.get("SQLITE_ROLE","writer")
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE","WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS","NORMAL")
+    # the scan and import_jsons write a generation that is only activated when it is complete, a crashed
+    # import is redone on resume, so its commits are not synced; a power loss may lose or corrupt them
+    SQLITE_BULK_SYNCHRONOUS = os.environ.get("SQLITE_BULK_SYNCHRONOUS","OFF")
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT",30000))
+    # negative cache sizes are KiB
+    SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE",-65536))
+    SQLITE_BULK_CACHE_SIZE = int(os.environ.get("SQLITE_BULK_CACHE_SIZE",-262144))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE",268435456))
+    SQLITE_TEMP_STORE = os.environ.get("SQLITE_TEMP_STORE","MEMORY")
     SAVEDIR = os.environ.get("SAVEDIR","")
+    SAVE_FORMAT = os.environ.get("SAVE_FORMAT","archive")
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
     APININJASKEY = os.environ.get("APININJASKEY","not set")
+    ASSET_STORE = os.environ.get("ASSET_STORE","assets.sqlite")
+    # logos and flags downloaded by the scan, served under /longweekend/assets
+    ASSET_MIRROR_DIR = os.environ.get("ASSET_MIRROR_DIR","asset_mirror")
+    KIWI_URL = os.environ.get("KIWI_URL","https://api.tequila.kiwi.com/v2/search")
+    KIWI_RATE_LIMIT = float(os.environ.get("KIWI_RATE_LIMIT",2))
+    KIWI_CONNECT_TIMEOUT = float(os.environ.get("KIWI_CONNECT_TIMEOUT",10))
+    KIWI_READ_TIMEOUT = float(os.environ.get("KIWI_READ_TIMEOUT",120))
+    KIWI_RETRIES = int(os.environ.get("KIWI_RETRIES",3))
+    SCAN_WORKERS = int(os.environ.get("SCAN_WORKERS",4))
+    # raw responses of the running scan, kept until they are imported so a died scan can be resumed
+    SCAN_SPOOL_DIR = os.environ.get("SCAN_SPOOL_DIR","spool")
+    # seconds a worker holds a scan job before another worker may take it over, renewed while it works
+    SCAN_JOB_LEASE = int(os.environ.get("SCAN_JOB_LEASE",600))
+    SCAN_JOB_ATTEMPTS = int(os.environ.get("SCAN_JOB_ATTEMPTS",10))
+    PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR","page_cache")
+    METRICS_DIR = os.environ.get("METRICS_DIR","metrics")
@@ -12,6 +12,8 @@ fi
 #Upgrade the database
 if [ -f migrations/alembic.ini ] ; then
   /home/$USER/.local/bin/uv run flask db upgrade
+  # monthly_top is only filled when a generation is activated, fill it from the actual searches
+  /home/$USER/.local/bin/uv run flask rebuild_top
 fi
 
 #Replace old cron job
@@ -19,7 +21,7 @@ currentpath=$(pwd)
 username=$(whoami)
 groupname=$(id -gn)
 crontab -l | grep -v "LongWeekend" > newcron
-echo "30 */6 * * * cd $currentpath && /home/$username/.local/bin/uv run flask scan >> $currentpath/log.log 2>&1" >> newcron
+echo "30 */6 * * * cd $currentpath && /home/$username/.local/bin/uv run flask scan --incremental --resume >> $currentpath/log.log 2>&1" >> newcron
 crontab newcron
 rm newcron
 
@@ -1,55 +1,67 @@
+-- itinerary is read through ix_itinerary_ranking (month, flyTo, price, search_id) in index order,
+-- so the first window needs no sort and no table row. CROSS JOIN keeps itinerary the outer loop.
 WITH ranked_by_destination AS (
     SELECT
-        *,
+        i.rowid AS itinerary_rowid,
+        i.month,
+        i.price,
         ROW_NUMBER() OVER (
-            PARTITION BY month, flyTo
-            ORDER BY price ASC
+            PARTITION BY i.month, i.flyTo
+            ORDER BY i.price ASC
         ) AS dest_rank
-    FROM itinerary as i
-    JOIN search s
-        ON i.search_id = s.rowid
-),
-cheapest_per_destination AS (
-    SELECT *
-    FROM ranked_by_destination
-    WHERE dest_rank = 1
+    FROM itinerary AS i
+    CROSS JOIN search s
+    WHERE s.rowid = i.search_id
+        AND s.actual = 1
 ),
 ranked_per_month AS (
     SELECT
-        *,
+        itinerary_rowid,
         ROW_NUMBER() OVER (
             PARTITION BY month
             ORDER BY price ASC
         ) AS month_rank
-    FROM cheapest_per_destination
+    FROM ranked_by_destination
+    WHERE dest_rank = 1
 )
 SELECT
-    rowid,
-    month,
-    flyFrom,
-    flyTo,
-    cityFrom,
-    cityTo,
-    countryFromCode,
-    countryToCode,
-    local_departure,
-    local_arrival,
-    rlocal_departure,
-    rlocal_arrival,
-    price,
-    durationDeparture,
-    durationReturn,
-    nightsInDest,
-    deep_link,
+    i.rowid,
+    i.month,
+    i.flyFrom,
+    i.flyTo,
+    place_from.city as cityFrom,
+    place_to.city as cityTo,
+    place_from.countryCode as countryFromCode,
+    place_to.countryCode as countryToCode,
+    i.local_departure,
+    i.local_arrival,
+    i.rlocal_departure,
+    i.rlocal_arrival,
+    i.price,
+    i.durationDeparture,
+    i.durationReturn,
+    i.nightsInDest,
+    b.deep_link,
     CASE
-        WHEN instr(airlines, ',') > 0
-        THEN substr(airlines, 1, instr(airlines, ',') - 1)
-        ELSE airlines
+        WHEN instr(i.airlines, ',') > 0
+        THEN substr(i.airlines, 1, instr(i.airlines, ',') - 1)
+        ELSE i.airlines
     END as firstairline,
-    currency,
-    fx_rate,
-    timestamp
+    s.currency,
+    s.fx_rate,
+    s.timestamp
 
-FROM ranked_per_month
-WHERE month_rank <= 5
-ORDER BY month, price;
\ No newline at end of file
+FROM ranked_per_month r
+-- the columns of the displayed rows are only looked up for the at most 65 winners
+JOIN itinerary i
+    ON i.rowid = r.itinerary_rowid
+JOIN search s
+    ON s.rowid = i.search_id
+JOIN place place_from
+    ON place_from.code = i.flyFrom
+JOIN place place_to
+    ON place_to.code = i.flyTo
+JOIN booking b
+    ON b.itinerary_id = i.rowid
+WHERE r.month_rank <= 5
+ORDER BY i.month, i.price;
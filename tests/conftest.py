@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from itertools import count
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from app import create_app, db
+from app.main import views
+from benchmarks.synthetic import search_response
+from config import Config
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app on a fresh SQLite database in tmp_path, with its app context pushed."""
+    # the SQL files are read relative to the project root, like the CLI does
+    monkeypatch.chdir(PROJECT_ROOT)
+    settings = dict(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.sqlite'}", SAVEDIR="",
+                    SCAN_SPOOL_DIR=str(tmp_path / "spool"), PAGE_CACHE_DIR=str(tmp_path / "page_cache"),
+                    METRICS_DIR=str(tmp_path / "metrics"), ASSET_STORE=str(tmp_path / "assets.sqlite"),
+                    ASSET_MIRROR_DIR=str(tmp_path / "asset_mirror"), KIWI_RATE_LIMIT=0)
+    for name, value in settings.items():
+        monkeypatch.setattr(Config, name, value)
+    monkeypatch.setattr(views.asset_resolver, "store_file", Config.ASSET_STORE)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+class KiwiStub:
+    """
+    Local HTTP server answering like the Kiwi search endpoint with synthetic responses.
+
+    Every request is recorded as (fly_from, date_from, time), peak is the most requests served at once.
+    fail(origin, *answers) queues (status, headers) answers the origin gets before its real responses,
+    fail_always(origin) never lets it succeed.
+    """
+
+    def __init__(self, itineraries: int = 20, delay: float = 0.0) -> None:
+        self.itineraries = itineraries
+        self.delay = delay
+        self.requests = []
+        self.answers = {}
+        self.failing = set()
+        self.active = 0
+        self.peak = 0
+        self.seeds = count()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v2/search"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def fail(self, origin: str, *answers: tuple[int, dict]) -> None:
+        self.answers.setdefault(origin, []).extend(answers)
+
+    def fail_always(self, origin: str) -> None:
+        self.failing.add(origin)
+
+    def requested(self, origin: str = None) -> list[tuple[str, str, float]]:
+        return [request for request in self.requests if origin is None or request[0] == origin]
+
+    def answer(self, query: dict) -> tuple[int, dict, bytes]:
+        origin, date_from = query["fly_from"][0], query["date_from"][0]
+        with self.lock:
+            self.requests.append((origin, date_from, time.monotonic()))
+            seed = next(self.seeds)
+            scripted = self.answers.get(origin)
+            answer = scripted.pop(0) if scripted else None
+        if answer is None and origin in self.failing:
+            answer = (500, {})
+        if answer is not None:
+            status, headers = answer
+            return status, headers, json.dumps({"error": f"stub answered {status}"}).encode()
+        response = search_response(self.itineraries, seed, datetime.strptime(date_from, "%d/%m/%Y"),
+                                   route_pool=200)
+        return 200, {}, json.dumps(response).encode()
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.active += 1
+                    stub.peak = max(stub.peak, stub.active)
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    status, headers, body = stub.answer(parse_qs(urlparse(self.path).query))
+                finally:
+                    with stub.lock:
+                        stub.active -= 1
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def kiwi_stub():
+    stub = KiwiStub()
+    yield stub
+    stub.close()
@@ -0,0 +1,85 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app.commands import DbUtils, make_importer
+from app.main.api import API_MAX_PAGE_SIZE
+from app.models import Itinerary, Search
+from benchmarks.synthetic import search_response
+
+RANGE_START = datetime(2026, 11, 1)
+API = "/longweekend/api/itineraries"
+
+
+def import_search(app, seed: int, prices: list[int]) -> int:
+    """Imports a search whose itineraries cost the given prices in turn, many of them the same price."""
+    response = search_response(120, seed, RANGE_START)
+    for number, itinerary in enumerate(response["data"]):
+        itinerary["price"] = prices[number % len(prices)]
+    db_utils = DbUtils(db, app.logger)
+    generation_id = db_utils.start_generation()
+    make_importer(False, generation_id).insert_json(
+        response, url="test", timestamp=datetime.now(), range_start=RANGE_START.date(),
+        range_end=(RANGE_START + timedelta(days=27)).date(), actual=False)
+    return generation_id
+
+
+@pytest.fixture
+def tied_prices(app):
+    """An actual search with three prices only, and a newer one that is not activated yet."""
+    assert DbUtils(db, app.logger).activate_generation(import_search(app, 7, [30000, 25000, 30000, 41000]))
+    import_search(app, 8, [25000])
+    return app
+
+
+def expected_ids(*destinations: str) -> list[int]:
+    query = (select(Itinerary.rowid).join(Search, Search.rowid == Itinerary.search_id)
+             .where(Search.actual.is_(True)).order_by(Itinerary.price, Itinerary.rowid))
+    if destinations:
+        query = query.where(Itinerary.flyTo.in_(destinations))
+    return db.session.scalars(query).all()
+
+
+def pages(client, query: str) -> list[list[dict]]:
+    """Follows the next cursors from the first page to the last."""
+    result = []
+    url = f"{API}?{query}"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        result.append(page["itineraries"])
+        if page["next"] is None:
+            return result
+        url = f"{API}?{query}&after={page['next']}"
+
+
+def test_pages_across_tied_prices(tied_prices):
+    result = pages(tied_prices.test_client(), "limit=7")
+
+    assert all(len(page) == 7 for page in result[:-1]) and 0 < len(result[-1]) <= 7
+    itineraries = [itinerary for page in result for itinerary in page]
+    # every actual itinerary once, in (price, id) order, the ties split across pages included
+    assert [itinerary["id"] for itinerary in itineraries] == expected_ids()
+    assert len(itineraries) == 120
+    assert Counter(itinerary["price"] for itinerary in itineraries) == {30000: 60, 25000: 30, 41000: 30}
+
+
+def test_multi_destination_merge(tied_prices):
+    destinations = [code for code, _ in Counter(db.session.scalars(select(Itinerary.flyTo))).most_common(3)]
+    query = f"destination={','.join(destinations)}&limit=4"
+
+    merged = [itinerary for page in pages(tied_prices.test_client(), query) for itinerary in page]
+    assert {itinerary["flyTo"] for itinerary in merged} == set(destinations)
+    assert [itinerary["id"] for itinerary in merged] == expected_ids(*destinations)
+
+
+@pytest.mark.parametrize("query", ["limit=0", f"limit={API_MAX_PAGE_SIZE + 1}", "limit=ten", "after=cheap",
+                                   "month=November"])
+def test_invalid_arguments(tied_prices, query):
+    response = tied_prices.test_client().get(f"{API}?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
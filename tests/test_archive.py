@@ -0,0 +1,64 @@
+import json
+import os
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+
+from benchmarks.synthetic import search_response
+from common.archive import DumpArchive, ARCHIVE_MAGIC, HEADER_LENGTH
+from common.kiwi import ResponseStream
+
+HEADER = {"search_id": "s-1", "url": "https://kiwi.invalid/v2/search?fly_from=BUD", "timestamp": "2026-10-17T04:00:00",
+          "range_start": "2026-11-01", "range_end": "2026-11-30", "results": 3, "currency": "HUF", "city": "Zürich"}
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    return str(tmp_path / "dump.lwa")
+
+
+def test_round_trip(archive_path):
+    raw = json.dumps(search_response(3, seed=2, range_start=datetime(2026, 11, 1))).encode()
+    DumpArchive.write(archive_path, HEADER, BytesIO(raw))
+
+    assert not os.path.exists(archive_path + ".tmp")
+    with DumpArchive(archive_path) as archive:
+        assert archive.header == HEADER
+        with archive.body() as body:
+            assert body.read() == raw
+        # the body can be streamed again, and the response read item by item
+        with archive.body() as body:
+            assert list(ResponseStream(body, chunk_size=100)) == json.loads(raw)["data"]
+
+
+def test_write_continues_from_the_position_of_body(archive_path):
+    body = BytesIO(b"skipped{}")
+    body.seek(7)
+    DumpArchive.write(archive_path, HEADER, body)
+    with DumpArchive(archive_path) as archive, archive.body() as archived:
+        assert archived.read() == b"{}"
+
+
+def write_raw(path: str, content: bytes) -> None:
+    with open(path, "wb") as fo:
+        fo.write(content)
+
+
+@pytest.mark.parametrize("content", [
+    ARCHIVE_MAGIC,
+    ARCHIVE_MAGIC + b"\x00\x00",
+    ARCHIVE_MAGIC + HEADER_LENGTH.pack(1000) + b'{"search_id": "s-1"}',
+    ARCHIVE_MAGIC + HEADER_LENGTH.pack(10) + b'{"search_i',
+], ids=["no length", "short length", "length beyond the file", "cut header"])
+def test_corrupt_header(archive_path, content):
+    write_raw(archive_path, content)
+    with pytest.raises(ValueError, match="corrupt header"):
+        DumpArchive(archive_path)
+
+
+@pytest.mark.parametrize("content, message", [(b"", "is empty"), (b'{"data": []}', "is not a dump archive")])
+def test_not_an_archive(archive_path, content, message):
+    write_raw(archive_path, content)
+    with pytest.raises(ValueError, match=message):
+        DumpArchive(archive_path)
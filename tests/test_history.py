@@ -0,0 +1,114 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func
+
+from app import db
+from app.commands import BulkSearchImporter
+from app.history import PriceHistory, observation_values, add_observation, SEEN_TABLE
+from app.models import PriceTrack, PriceChange
+from benchmarks.synthetic import search_response
+
+NOVEMBER = (date(2026, 11, 1), date(2026, 11, 30))
+T1 = datetime(2026, 10, 1, 6)
+T2 = T1 + timedelta(hours=6)
+T3 = T2 + timedelta(hours=6)
+
+
+def observations(*itineraries: dict, price_offset: int = 0) -> dict[int, dict]:
+    observed = {}
+    for itinerary in itineraries:
+        add_observation(observed, dict(observation_values(itinerary), price=itinerary["price"] + price_offset))
+    return observed
+
+
+@pytest.fixture
+def itineraries(app):
+    first, second, third = search_response(3, seed=3, range_start=datetime(2026, 11, 1))["data"]
+    december = search_response(1, seed=4, range_start=datetime(2026, 12, 1))["data"][0]
+    return first, second, third, december
+
+
+def history_rows(fingerprint: int) -> list[tuple]:
+    return db.session.execute(select(PriceChange.observed, PriceChange.price)
+                              .where(PriceChange.fingerprint == fingerprint)
+                              .order_by(PriceChange.observed)).all()
+
+
+def test_withdrawn_and_reappearing_tracks(itineraries):
+    first, second, third, december = itineraries
+    history = PriceHistory(db.session)
+    a, b, c = (observation_values(itinerary)["fingerprint"] for itinerary in (first, second, third))
+
+    assert history.record(T1, observations(first, second, third), *NOVEMBER) == 3
+    assert history.record(T1, observations(december)) == 1
+    # b is no longer offered, a and c are unchanged, the December track is outside the window
+    assert history.record(T2, observations(first, third), *NOVEMBER) == 1
+    # b is offered again, c got cheaper
+    assert history.record(T3, observations(first, second) | observations(third, price_offset=-1000),
+                          *NOVEMBER) == 2
+
+    assert history_rows(a) == [(T1, first["price"])]
+    assert history_rows(b) == [(T1, second["price"]), (T2, None), (T3, second["price"])]
+    assert history_rows(c) == [(T1, third["price"]), (T3, third["price"] - 1000)]
+    assert history_rows(observation_values(december)["fingerprint"]) == [(T1, december["price"])]
+    assert db.session.scalar(select(func.count()).select_from(PriceTrack)) == 4
+    assert history.offered(["BUD"], *NOVEMBER) == {a, b, c}
+
+
+def test_withdrawn_track_stays_withdrawn_until_offered(itineraries):
+    first, second, _, _ = itineraries
+    history = PriceHistory(db.session)
+    b = observation_values(second)["fingerprint"]
+
+    history.record(T1, observations(first, second), *NOVEMBER)
+    history.record(T2, observations(first), *NOVEMBER)
+    assert history.record(T3, observations(first), *NOVEMBER) == 0
+    assert history_rows(b) == [(T1, second["price"]), (T2, None)]
+    assert b not in history.offered(["BUD"], *NOVEMBER)
+
+
+def test_history_only_moves_forward(itineraries):
+    first, second, _, _ = itineraries
+    history = PriceHistory(db.session)
+    history.record(T2, observations(first, second), *NOVEMBER)
+
+    # an older scan imported late neither changes prices nor withdraws tracks
+    assert history.record(T1, observations(first, price_offset=500), *NOVEMBER) == 0
+    assert history.record(T2, observations(first, price_offset=500), *NOVEMBER) == 0
+    assert history_rows(observation_values(second)["fingerprint"]) == [(T2, second["price"])]
+
+
+def test_cheapest_replays_the_changes(itineraries):
+    first, second, _, _ = itineraries
+    history = PriceHistory(db.session)
+    cheap, dear = sorted((first, second), key=lambda itinerary: itinerary["price"])
+    if cheap["flyTo"] != dear["flyTo"]:
+        dear = dict(dear, flyTo=cheap["flyTo"])
+    month = observation_values(cheap)["month"]
+
+    history.record(T1, observations(cheap, dear), *NOVEMBER)
+    history.record(T2, observations(dear), *NOVEMBER)
+    history.record(T3, observations(cheap, dear), *NOVEMBER)
+    assert history.cheapest(cheap["flyTo"], month) == [(T1, cheap["price"]), (T2, dear["price"]),
+                                                       (T3, cheap["price"])]
+
+
+def test_bulk_import_records_the_history_batch_by_batch(itineraries):
+    first, second, third, _ = itineraries
+    # the same flights offered again cheaper in a later batch of the response
+    cheaper = dict(first, id="cheaper", price=first["price"] - 100)
+    a, b = (observation_values(itinerary)["fingerprint"] for itinerary in (first, second))
+
+    def import_batches(observed: datetime, search_id: str, *batches: list[dict]) -> None:
+        header = {"search_id": search_id, "currency": "HUF", "fx_rate": 385.5}
+        assert BulkSearchImporter().insert_rows(header, map(BulkSearchImporter.batch_rows, batches),
+                                                timestamp=observed, range_start=NOVEMBER[0], range_end=NOVEMBER[1])
+
+    import_batches(T1, "s-1", [first, second], [third, cheaper])
+    assert history_rows(a) == [(T1, cheaper["price"])]
+    # the second scan no longer offers b, the fingerprints of the first one are forgotten
+    import_batches(T2, "s-2", [first], [third])
+    assert history_rows(a) == [(T1, cheaper["price"]), (T2, first["price"])]
+    assert history_rows(b) == [(T1, second["price"]), (T2, None)]
+    assert db.session.execute(select(SEEN_TABLE.c.fingerprint)).all() == []
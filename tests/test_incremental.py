@@ -0,0 +1,84 @@
+import copy
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from app import db
+from app.commands import DbUtils, make_importer
+from app.models import Search, Itinerary, Booking
+from benchmarks.synthetic import search_response
+from common.kiwi import KIWI_DATETIME_FORMAT
+
+RANGE_START = datetime(2026, 11, 1)
+
+
+def rescan(response: dict, changed: set[int]) -> dict:
+    """The same offers in a new search: new Kiwi ids and booking links, the changed itineraries got dearer."""
+    response = copy.deepcopy(response)
+    response["search_id"] = str(uuid.uuid4())
+    for number, itinerary in enumerate(response["data"]):
+        itinerary["id"] = f"rescan-{number}"
+        itinerary["deep_link"] = f"https://www.kiwi.com/deep?rescan={number}"
+        if number in changed:
+            itinerary["price"] += 1000
+    return response
+
+
+def import_generation(app, response: dict, incremental: bool):
+    db_utils = DbUtils(db, app.logger)
+    generation_id = db_utils.start_generation()
+    importer = make_importer(False, generation_id, incremental)
+    importer.insert_json(response, url="test", timestamp=datetime.now(), range_start=RANGE_START.date(),
+                         range_end=(RANGE_START + timedelta(days=27)).date(), actual=False)
+    assert db_utils.activate_generation(generation_id, importer.carried)
+    return importer
+
+
+def actual_offers() -> list[tuple]:
+    rows = db.session.execute(select(Itinerary.flyTo, Itinerary.local_departure, Itinerary.price, Booking.deep_link)
+                              .join(Search, Search.rowid == Itinerary.search_id)
+                              .join(Booking, Booking.itinerary_id == Itinerary.rowid)
+                              .where(Search.actual.is_(True)))
+    return sorted(rows)
+
+
+def test_unchanged_itineraries_are_carried_forward(app):
+    first = search_response(20, seed=5, range_start=RANGE_START)
+    import_generation(app, first, incremental=True)
+    stored = dict(db.session.execute(select(Itinerary.itinerary_id, Itinerary.rowid)).all())
+
+    changed = {0, 3, 4, 11}
+    second = rescan(first, changed)
+    importer = import_generation(app, second, incremental=True)
+
+    (search_rowid, carried), = importer.carried.items()
+    assert importer.rows_carried == len(carried) == 20 - len(changed)
+    # the stored rows of the unchanged offers moved to the new search, only the changed ones were inserted
+    assert sorted(carried) == sorted(stored[f"5-{number}"] for number in range(20) if number not in changed)
+    assert db.session.scalar(select(func.count()).select_from(Itinerary)
+                             .where(Itinerary.search_id == search_rowid)) == 20
+    assert db.session.scalar(select(func.count()).select_from(Search).where(Search.actual.is_(True))) == 1
+    # the carried rows got the booking links of the new search
+    assert actual_offers() == sorted(
+        (itinerary["flyTo"], datetime.strptime(itinerary["local_departure"], KIWI_DATETIME_FORMAT),
+         itinerary["price"], itinerary["deep_link"]) for itinerary in second["data"])
+
+    DbUtils(db, app.logger).delete_notactual_searches()
+    assert db.session.scalar(select(func.count()).select_from(Itinerary)) == 20
+
+
+def test_incremental_scan_matches_a_full_import(app):
+    first = search_response(30, seed=6, range_start=RANGE_START)
+    second = rescan(first, set(range(0, 30, 3)))
+    import_generation(app, first, incremental=True)
+    importer = import_generation(app, second, incremental=True)
+    assert importer.rows_carried == 20
+    incremental = actual_offers()
+
+    third = rescan(second, set())
+    import_generation(app, third, incremental=False)
+    full = actual_offers()
+    # the same offers, only the booking links of the newest search differ
+    assert [offer[:3] for offer in incremental] == [offer[:3] for offer in full]
+    assert len(full) == 30
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+from io import BytesIO
+
+import pytest
+
+from benchmarks.synthetic import search_response
+from common.kiwi import ResponseStream
+
+
+def body(response: dict) -> bytes:
+    return json.dumps(response, ensure_ascii=False).encode("utf-8")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 4096])
+def test_items_and_header_across_chunk_boundaries(chunk_size):
+    response = search_response(5, seed=1, range_start=datetime(2026, 11, 1))
+    # multibyte characters and numbers whose digits may be cut by a chunk boundary
+    response["data"][0]["cityTo"] = "Zürich – Ελλάδα 東京"
+    response["data"][1]["price"] = 123456789.25
+    response["data"][2]["quality"] = -1.5e-7
+    stream = ResponseStream(BytesIO(body(response)), chunk_size=chunk_size)
+
+    assert list(stream) == response["data"]
+    assert stream.header == {key: value for key, value in response.items() if key != "data"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_fields_after_data_are_read_by_exhaust(chunk_size):
+    raw = b'{ "search_id" : "s",\n "data": [ {"price": 10}, {"price": 2e3} ] ,"_results":2, "fx_rate": 385.5}'
+    stream = ResponseStream(BytesIO(raw), chunk_size=chunk_size)
+
+    assert next(iter(stream)) == {"price": 10}
+    assert stream.header == {"search_id": "s"}
+    assert stream.exhaust() == {"search_id": "s", "_results": 2, "fx_rate": 385.5}
+
+
+@pytest.mark.parametrize("raw", [b'{}', b'{"data": []}', b' {"_results": 0, "data" : [ ] } '])
+def test_empty_responses(raw):
+    stream = ResponseStream(BytesIO(raw), chunk_size=1)
+    assert list(stream) == []
+
+
+@pytest.mark.parametrize("raw", [b'{"data": [{"price": 1}', b'{"data": [{"price": 1} {"price": 2}]}', b'[]'])
+def test_truncated_or_malformed_responses_raise(raw):
+    with pytest.raises(ValueError):
+        list(ResponseStream(BytesIO(raw), chunk_size=3))
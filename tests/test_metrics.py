@@ -0,0 +1,20 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app.metrics import instrument_engine, metrics, timer
+
+
+def test_failed_statements_leave_nothing_on_the_connection():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as connection:
+        with timer("test_failed_statements"):
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text("SELECT * FROM missing"))
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+        info = dict(connection.info)
+
+    assert metrics.snapshot()["test_failed_statements"]["statements"] == 1
+    assert info == {}
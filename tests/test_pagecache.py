@@ -0,0 +1,27 @@
+import os
+
+from common.pagecache import PageCache
+
+
+def test_a_late_request_keeps_the_new_version(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("longweekend", "g1", "first")
+
+    # the scan warms the page of the new generation while a request still renders the old one
+    cache.replace("longweekend", "g2", "second")
+    assert not os.path.exists(cache.path("longweekend", "g1"))
+    cache.put("longweekend", "g1", "first, late")
+
+    assert cache.get("longweekend", "g2") == "second"
+    assert cache.get("longweekend", "g1") == "first, late"
+    # the next scan drops every other version
+    cache.replace("longweekend", "g3", "third")
+    assert sorted(os.listdir(tmp_path)) == ["longweekend.g3.html"]
+
+
+def test_replace_keeps_other_pages(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("other", "g1", "other page")
+    cache.replace("longweekend", "g1", "page")
+    assert cache.get("other", "g1") == "other page"
+    assert cache.get("longweekend", "g2") is None
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.commands import DbUtils, make_importer, MONTHLY_TOP_SQL
+from app.queryplan import query_plan, plan_problems, RANKING_TABLES, RANKING_COVERED
+from benchmarks.synthetic import search_response
+
+# the tables the queries of the page and the API read, by the names their plans use
+PAGE_TABLES = {"monthly_top": "monthly_top", "search": "search", "generation": "generation",
+               "itinerary": "itinerary", "booking": "booking", "place_from": "place", "place_to": "place",
+               "itinerary2route": "itinerary2route"}
+API_REQUESTS = ["", "?month=2026-12", "?destination=LHR", "?destination=LHR,CDG,FCO", "?origin=BUD&country=GB",
+                "?max_price=90000&nights=3&max_duration=600", "?direct=1", "?after=50000:3&limit=10"]
+
+
+@pytest.fixture
+def synthetic_db(app):
+    """Four months of actual synthetic searches in an activated generation, monthly_top included."""
+    db_utils = DbUtils(db, app.logger)
+    generation_id = db_utils.start_generation()
+    importer = make_importer(False, generation_id)
+    for seed in range(4):
+        start = datetime(2026, 11, 1) + timedelta(days=31 * seed)
+        importer.insert_json(search_response(200, seed, start, route_pool=300), url="test", timestamp=datetime.now(),
+                             range_start=start.date(), range_end=(start + timedelta(days=27)).date(), actual=False)
+    assert db_utils.activate_generation(generation_id)
+    return app
+
+
+def executed_selects(app, paths: list[str]) -> list[tuple[str, tuple]]:
+    """Requests the paths and returns the SELECT statements they sent to SQLite with their parameters."""
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        client = app.test_client()
+        for path in paths:
+            assert client.get(path).status_code == 200
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    return statements
+
+
+def problems_of(statements: list[tuple[str, tuple]]) -> list[str]:
+    problems = []
+    with db.engine.connect() as connection:
+        for statement, parameters in statements:
+            problems += plan_problems(query_plan(connection, statement, parameters), PAGE_TABLES, set())
+    return problems
+
+
+def test_ranking_plan(synthetic_db):
+    with open(MONTHLY_TOP_SQL) as f:
+        ranking = f.read()
+    with db.engine.connect() as connection:
+        assert plan_problems(query_plan(connection, ranking), RANKING_TABLES, RANKING_COVERED) == []
+
+
+def test_longweekend_plans(synthetic_db):
+    statements = executed_selects(synthetic_db, ["/longweekend"])
+    assert any("monthly_top" in statement for statement, _ in statements)
+    assert problems_of(statements) == []
+
+
+def test_api_plans(synthetic_db):
+    statements = executed_selects(synthetic_db, [f"/longweekend/api/itineraries{query}" for query in API_REQUESTS])
+    assert len(statements) >= len(API_REQUESTS)
+    assert problems_of(statements) == []
+
+
+def test_plan_problems_reports_a_sorted_scan(synthetic_db):
+    with db.engine.connect() as connection:
+        plan = query_plan(connection, "SELECT * FROM itinerary WHERE airlines = ? ORDER BY quality", ("FR",))
+    assert len(plan_problems(plan, PAGE_TABLES, set())) == 2
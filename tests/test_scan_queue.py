@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from io import BytesIO
+
+import pytest
+from sqlalchemy import select, update, func
+
+from app import db, scanqueue, commands
+from app.commands import DbUtils, QueueWorker, make_queue, queue_scan, spool_file, part_file, download_job
+from app.models import Search, Generation, ScanJob, ScanOrigin
+from app.scanqueue import LeaseLost
+from common.kiwi import Tequila, ResponseStream, SearchResponse
+
+
+def add_origin(code: str, months: int = 2) -> None:
+    db.session.add(ScanOrigin(code=code, nights_from=2, nights_to=3, months=months, enabled=True))
+    db.session.commit()
+
+
+def make_worker(app, stub, owner: str, workers: int = 2, retries: int = 0) -> QueueWorker:
+    kiwi = Tequila("key", stub.url, pool_size=workers, timeout=(5, 5), retries=retries, backoff_factor=0)
+    worker = QueueWorker(make_queue(), DbUtils(db, app.logger), kiwi, False, False, workers, app.logger)
+    worker.owner = owner
+    return worker
+
+
+def jobs() -> list:
+    job = ScanJob.__table__
+    return db.session.execute(select(job).order_by(job.c.rowid)).all()
+
+
+def expire_leases() -> None:
+    db.session.execute(update(ScanJob.__table__).where(ScanJob.__table__.c.lease_expires.isnot(None))
+                       .values(lease_expires=datetime.now() - timedelta(seconds=1)))
+    db.session.commit()
+
+
+def imported_ranges(generation_id: int) -> list[date]:
+    return db.session.scalars(select(Search.range_start).where(Search.generation_id == generation_id)
+                              .order_by(Search.range_start)).all()
+
+
+def test_worker_leases_downloads_imports_and_activates(app, kiwi_stub):
+    add_origin("BUD", months=3)
+    generation_id = queue_scan(resume=False)
+    worker = make_worker(app, kiwi_stub, "a")
+    worker.run()
+
+    assert [job.state for job in jobs()] == [ScanJob.IMPORTED] * 3
+    assert len(kiwi_stub.requested()) == 3
+    assert len(imported_ranges(generation_id)) == 3
+    assert worker.activated
+    assert db.session.scalar(select(Generation.active).where(Generation.rowid == generation_id))
+    assert db.session.scalar(select(func.count()).select_from(Search).where(Search.actual.is_(True))) == 3
+    assert os.listdir(app.config["SCAN_SPOOL_DIR"]) == []
+
+
+def test_tequila_retries_429_and_5xx_after_retry_after(kiwi_stub):
+    kiwi_stub.fail("BUD", (429, {"Retry-After": "1"}), (503, {}))
+    kiwi = Tequila("key", kiwi_stub.url, retries=3, backoff_factor=0)
+    fp = BytesIO()
+    started = time.monotonic()
+    response = kiwi.download(fp, "BUD", date(2026, 11, 1), date(2026, 11, 30))
+    kiwi.close()
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 1
+    assert kiwi.request_count == 3
+    fp.seek(0)
+    assert len(list(ResponseStream(fp))) == kiwi_stub.itineraries
+
+
+def test_failed_download_is_queued_again_after_a_backoff(app, kiwi_stub, monkeypatch):
+    monkeypatch.setattr(scanqueue, "RETRY_BACKOFF", timedelta(seconds=0.3))
+    monkeypatch.setitem(app.config, "SCAN_JOB_ATTEMPTS", 3)
+    add_origin("BUD", months=1)
+    add_origin("ZZZ", months=1)
+    kiwi_stub.fail("BUD", (500, {}))
+    kiwi_stub.fail_always("ZZZ")
+    generation_id = queue_scan(resume=False)
+    make_worker(app, kiwi_stub, "a").run()
+
+    bud, zzz = sorted(jobs(), key=lambda job: job.fly_from)
+    assert (bud.state, bud.attempts) == (ScanJob.IMPORTED, 2)
+    assert (zzz.state, zzz.attempts) == (ScanJob.FAILED, 3)
+    assert "500" in zzz.error
+    first, second = kiwi_stub.requested("BUD")
+    assert second[2] - first[2] >= 0.3
+    # a failed origin does not hold back the rest of the scan
+    assert db.session.scalar(select(Generation.active).where(Generation.rowid == generation_id))
+
+
+def test_reopen_requeues_only_expired_leases(app):
+    add_origin("BUD", months=2)
+    generation_id = queue_scan(resume=False)
+    queue = make_queue()
+    leased = queue.lease("a", 1)
+    queue.reopen(generation_id)
+    assert [(job.state, job.lease_owner) for job in jobs()] == [(ScanJob.LEASED, "a"), (ScanJob.QUEUED, None)]
+    assert queue.lease("b", 2) == [jobs()[1]]
+
+    expire_leases()
+    queue.reopen(generation_id)
+    assert [job.state for job in jobs()] == [ScanJob.QUEUED, ScanJob.QUEUED]
+    assert not queue.fetched(leased[0], "url")
+
+
+def test_expired_lease_drops_the_late_download(app, kiwi_stub):
+    add_origin("BUD", months=1)
+    generation_id = queue_scan(resume=False)
+    worker_a = make_worker(app, kiwi_stub, "a")
+    worker_b = make_worker(app, kiwi_stub, "b")
+    os.makedirs(worker_a.spool_dir, exist_ok=True)
+    (job_a,) = worker_a.queue.lease("a", 1)
+    expire_leases()
+    (job_b,) = worker_b.queue.lease("b", 1)
+
+    # a finishes its download after b took the job over
+    partial = part_file(worker_a.spool_dir, job_a.rowid, "a")
+    with open(partial, "wb") as fo:
+        fo.write(b"{}")
+    future = Future()
+    future.set_result(SearchResponse(200, kiwi_stub.url, None))
+    worker_a.handle(job_a, future)
+    assert not os.path.exists(partial)
+    assert not os.path.exists(spool_file(worker_a.spool_dir, job_a.rowid))
+    assert worker_a.queue.retry(job_a, "late") is None
+
+    future = Future()
+    future.set_result(download_job(worker_b.kiwi, job_b, part_file(worker_b.spool_dir, job_b.rowid, "b"),
+                                   app.logger))
+    worker_b.handle(job_b, future)
+    worker_b.finish_generations()
+    assert [(job.state, job.attempts) for job in jobs()] == [(ScanJob.IMPORTED, 2)]
+    assert len(imported_ranges(generation_id)) == 1
+    assert db.session.scalar(select(Generation.active).where(Generation.rowid == generation_id))
+
+
+def test_spooled_job_is_imported_once(app, kiwi_stub):
+    add_origin("BUD", months=1)
+    generation_id = queue_scan(resume=False)
+    worker_a = make_worker(app, kiwi_stub, "a")
+    worker_b = make_worker(app, kiwi_stub, "b")
+    os.makedirs(worker_a.spool_dir, exist_ok=True)
+    (job_a,) = worker_a.queue.lease("a", 1)
+    path = spool_file(worker_a.spool_dir, job_a.rowid)
+    with open(path, "wb") as fo:
+        worker_a.kiwi.download(fo, "BUD", job_a.range_start, job_a.range_end)
+    assert worker_a.queue.fetched(job_a, kiwi_stub.url)
+    # a stalls before importing, b takes the job over and finds the spooled response
+    expire_leases()
+    (job_b,) = worker_b.queue.lease("b", 1)
+
+    with pytest.raises(LeaseLost):
+        worker_a.import_response(job_a, kiwi_stub.url)
+    db.session.rollback()
+    worker_a.importers.clear()
+    worker_a.import_job(job_a, kiwi_stub.url)
+    assert os.path.exists(path)
+    worker_b.import_job(job_b, kiwi_stub.url)
+    worker_b.finish_generations()
+
+    assert len(imported_ranges(generation_id)) == 1
+    assert not os.path.exists(path)
+    assert len(kiwi_stub.requested()) == 1
+    assert db.session.scalar(select(Generation.active).where(Generation.rowid == generation_id))
+
+
+def test_concurrent_scan_resume_and_worker_import_each_job_once(app, kiwi_stub):
+    kiwi_stub.delay = 0.2
+    add_origin("BUD", months=6)
+    add_origin("VIE", months=3)
+    generation_id = queue_scan(resume=False)
+    errors = []
+
+    def work(owner: str, resume: bool) -> None:
+        with app.app_context():
+            try:
+                if resume:
+                    # flask schedule --resume next to a live scan keeps its leases
+                    assert queue_scan(resume=True) == generation_id
+                make_worker(app, kiwi_stub, owner).run()
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                db.session.remove()
+
+    scan = threading.Thread(target=work, args=("scan", False))
+    scan.start()
+    time.sleep(0.1)
+    resumed = threading.Thread(target=work, args=("worker", True))
+    resumed.start()
+    scan.join(60)
+    resumed.join(60)
+
+    assert errors == []
+    # both workers downloaded at the same time, each has 2 threads
+    assert kiwi_stub.peak > 2
+    requested = [(origin, date_from) for origin, date_from, _ in kiwi_stub.requested()]
+    assert len(requested) == len(set(requested)) == 9
+    assert [job.state for job in jobs()] == [ScanJob.IMPORTED] * 9
+    searches = db.session.execute(select(Search.rowid).where(Search.generation_id == generation_id)).all()
+    assert len(searches) == 9
+    assert sorted(job.search_rowid for job in jobs()) == sorted(rowid for rowid, in searches)
+    assert db.session.scalar(select(Generation.active).where(Generation.rowid == generation_id))
+    assert os.listdir(app.config["SCAN_SPOOL_DIR"]) == []
+
+
+@pytest.mark.parametrize("save_format", ["archive", "json"])
+def test_failure_to_keep_an_imported_response_is_not_a_lost_lease(app, kiwi_stub, tmp_path, monkeypatch,
+                                                                    save_format):
+    monkeypatch.setitem(app.config, "SAVEDIR", str(tmp_path / "dumps"))
+    monkeypatch.setitem(app.config, "SAVE_FORMAT", save_format)
+
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(commands.SearchImporter, "save_archive", fail)
+    monkeypatch.setattr(commands.shutil, "move", fail)
+    add_origin("BUD", months=2)
+    generation_id = queue_scan(resume=False)
+    worker = make_worker(app, kiwi_stub, "a")
+    lost = []
+    monkeypatch.setattr(worker, "lost", lost.append)
+    worker.run()
+
+    assert lost == []
+    assert [job.state for job in jobs()] == [ScanJob.IMPORTED] * 2
+    assert len(imported_ranges(generation_id)) == 2
+    assert worker.activated
+    assert os.listdir(app.config["SCAN_SPOOL_DIR"]) == []